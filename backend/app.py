@@ -52,7 +52,7 @@ from .services import economics as economics_svc
 from .services import local_sync as local_sync_svc
 from .services import report_pdf as report_pdf_svc
 from .services import report_ai_polish as report_ai_polish_svc
-from .services.app_paths import OUTPUTS_DIR, ensure_dirs as _ensure_data_dirs
+from .services.app_paths import data_root, outputs_dir
 
 
 logger = logging.getLogger("load-analysis")
@@ -75,11 +75,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 启动时确保可写数据目录存在（桌面版落到 AppData）
-_ensure_data_dirs()
+class _OutputsStaticFiles(StaticFiles):
+    """outputs 静态目录：启动时只计算路径，首次请求前才经 outputs_dir() 确保目录存在"""
 
-# 挂载 outputs 目录用于下载导出报表（CSV/ZIP 等）
-app.mount("/outputs", StaticFiles(directory=str(OUTPUTS_DIR)), name="outputs")
+    async def check_config(self) -> None:
+        outputs_dir()
+        await super().check_config()
+
+
+# 挂载 outputs 目录用于下载导出报表（CSV/ZIP 等）；
+# 此处只计算路径（check_dir=False），目录由首次导出 / 首次下载请求时的 outputs_dir() 创建（桌面版落到 AppData）
+app.mount("/outputs", _OutputsStaticFiles(directory=str(data_root() / "outputs"), check_dir=False), name="outputs")
 
 
 @app.post("/api/load/analyze", response_model=LoadAnalysisResponse)
@@ -516,8 +522,9 @@ async def compute_storage_cycles(
     monthly_schedule = strategy_src.get("monthlySchedule")
     date_rules = strategy_src.get("dateRules")
 
+    daily_tou: Dict[str, List[str]] | None = None
     try:
-        daily_ops = cycles_svc.build_daily_ops(series_15m, monthly_schedule, date_rules)
+        daily_ops, daily_tou = cycles_svc.build_daily_ops_and_tou(series_15m, monthly_schedule, date_rules)
         daily_masks, merged_cnt, runs_debug = cycles_svc.build_daily_cycles_masks(
             daily_ops,
             merge_threshold_minutes=merge_threshold_minutes,
@@ -541,6 +548,7 @@ async def compute_storage_cycles(
             monthly_schedule=monthly_schedule,
             date_rules=date_rules,
             monthly_prices=monthly_prices,
+            daily_tou=daily_tou,
         )
     except Exception as exc:
         logger.exception("TOU map failed: %s", exc)
@@ -768,7 +776,7 @@ async def compute_storage_cycles(
         from pathlib import Path as _Path  # noqa: WPS433
 
         ts_dir = _dt.now().strftime("%Y%m%d_%H%M%S")
-        out_dir = OUTPUTS_DIR / ts_dir
+        out_dir = outputs_dir() / ts_dir
         try:
             # 生成逐 15 分钟功率 / 负荷序列，供导出调试
             try:
@@ -814,7 +822,7 @@ async def compute_storage_cycles(
                 )
                 # 转换为可通过 /outputs 静态路径访问的相对 URL
                 try:
-                    rel = xlsx_path.relative_to(OUTPUTS_DIR)
+                    rel = xlsx_path.relative_to(outputs_dir())
                     excel_rel = f"/outputs/{rel.as_posix()}"
                 except Exception:
                     excel_rel = f"/outputs/{xlsx_path.name}"
@@ -836,7 +844,7 @@ async def compute_storage_cycles(
                     energy_formula=energy_formula,
                 )
                 try:
-                    rel = xlsx_path.relative_to(OUTPUTS_DIR)
+                    rel = xlsx_path.relative_to(outputs_dir())
                     excel_rel = f"/outputs/{rel.as_posix()}"
                 except Exception:
                     excel_rel = f"/outputs/{xlsx_path.name}"
@@ -901,7 +909,7 @@ async def compute_storage_curves(
     date_rules = strategy_src.get("dateRules")
 
     try:
-        daily_ops = cycles_svc.build_daily_ops(series_15m, monthly_schedule, date_rules)
+        daily_ops, daily_tou = cycles_svc.build_daily_ops_and_tou(series_15m, monthly_schedule, date_rules)
     except Exception as exc:
         logger.exception("strategy build failed (curves): %s", exc)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"strategy build failed: {exc}") from exc
@@ -914,6 +922,7 @@ async def compute_storage_curves(
             monthly_schedule=monthly_schedule,
             date_rules=date_rules,
             monthly_prices=monthly_prices,
+            daily_tou=daily_tou,
         )
     except Exception as exc:
         logger.exception("TOU map failed (curves): %s", exc)
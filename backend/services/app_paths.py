@@ -7,51 +7,188 @@ Program Files 时因权限不足导致写入失败。
 
 普通开发/Web 部署模式下，退化为项目根目录下的相对路径
 （保持向后兼容）。
+
+路径均通过带缓存的访问函数惰性计算（``data_root()`` / ``outputs_dir()`` 等），
+仅在首次真正需要时才读取环境变量 / cwd，目录也在首次访问时才创建；
+旧的 ``DATA_ROOT`` 等模块常量通过模块级 ``__getattr__``（PEP 562）继续可用。
 """
 
 from __future__ import annotations
 
+import functools
 import os
 import sys
+import threading
 from pathlib import Path
+from typing import Any, Optional, Set
 
 
 # 应用名称（用于 AppData 子目录）
 APP_NAME = "TouEditor"
 
+# FOLDERID_LocalAppData
+_FOLDERID_LOCAL_APP_DATA = "F1B32785-6FBA-4FCF-9D55-7B8E7F157091"
+
+
+# 本进程内已确认存在的目录，避免重复 mkdir 系统调用
+_created: Set[str] = set()
 
-def _is_frozen() -> bool:
-    """判断是否处于 PyInstaller 打包环境"""
-    return getattr(sys, "frozen", False)
+# ensure_dirs() 是否已完成；多处防御性调用时只在首次真正执行
+_dirs_ensured = False
+_dirs_lock = threading.Lock()
 
 
-def _get_data_root() -> Path:
+def _ensure_dir(path: str) -> str:
+    """
+    确保目录存在；同一进程内对同一路径只真正创建一次。
+
+    直接尝试 os.mkdir（Windows 下即一次 CreateDirectoryW），已存在视为成功；
+    父目录缺失时先递归确保父目录（同样记入缓存），再创建叶子目录；根目录本身不存在时抛出 FileNotFoundError。
+    outputs / local_sync_store 共享 DATA_ROOT，父目录因此只会被创建一次。
+    """
+    if path in _created:
+        return path
+    try:
+        os.mkdir(path)
+    except FileExistsError:
+        pass
+    except FileNotFoundError:
+        parent = os.path.dirname(path)
+        # 已到根目录（如未挂载的盘符 / UNC 共享）仍不存在时停止递归，抛出原始错误
+        if not parent or parent == path:
+            raise
+        _ensure_dir(parent)
+        try:
+            os.mkdir(path)
+        except FileExistsError:
+            pass
+    _created.add(path)
+    return path
+
+
+def _known_local_app_data() -> Optional[str]:
     """
-    获取可写数据根目录：
+    通过 SHGetKnownFolderPath(FOLDERID_LocalAppData) 获取 LocalAppData 目录。
+
+    不依赖进程环境块，服务/精简环境下 LOCALAPPDATA 缺失或过期时仍可用；
+    非 Windows 或调用失败时返回 None，由调用方回退到环境变量。
+    """
+    if sys.platform != "win32":
+        return None
+    try:
+        import ctypes
+        import uuid
+        from ctypes import wintypes
+
+        class _GUID(ctypes.Structure):
+            _fields_ = [
+                ("Data1", wintypes.DWORD),
+                ("Data2", wintypes.WORD),
+                ("Data3", wintypes.WORD),
+                ("Data4", ctypes.c_ubyte * 8),
+            ]
+
+        folder_id = _GUID.from_buffer_copy(uuid.UUID(_FOLDERID_LOCAL_APP_DATA).bytes_le)
+        buf = ctypes.c_wchar_p()
+        hr = ctypes.windll.shell32.SHGetKnownFolderPath(
+            ctypes.byref(folder_id), 0, None, ctypes.byref(buf)
+        )
+        try:
+            return buf.value if hr == 0 else None
+        finally:
+            ctypes.windll.ole32.CoTaskMemFree(buf)
+    except Exception:
+        return None
+
+
+def _join(parent: str, name: str) -> str:
+    """拼接单级子路径；parent 已是规范化绝对路径，无需 os.path.join 的通用处理"""
+    return f"{parent.rstrip(os.sep)}{os.sep}{name}"
+
+
+@functools.lru_cache(maxsize=1)
+def _data_root_str() -> str:
+    """
+    获取可写数据根目录（内部以 str 表示，仅在公开访问函数处包装为 Path）：
     - 桌面版 (frozen): %LOCALAPPDATA%\\TouEditor
     - 开发 / Web 部署:  当前工作目录
     """
-    if _is_frozen():
-        local_app_data = os.environ.get("LOCALAPPDATA")
+    # PyInstaller 打包环境（桌面版）
+    if getattr(sys, "frozen", False):
+        local_app_data = _known_local_app_data() or os.environ.get("LOCALAPPDATA")
         if local_app_data:
-            return Path(local_app_data) / APP_NAME
-        # 备选：HOME 目录
-        return Path.home() / f".{APP_NAME}"
-    # 非桌面版：使用 cwd（与原有行为一致）
-    return Path.cwd()
+            return _join(local_app_data, APP_NAME)
+        # 备选：HOME 目录（仅在取不到 LocalAppData 时才探测，结果同样被缓存）
+        return _join(os.path.expanduser("~"), f".{APP_NAME}")
+    # 非桌面版：使用 cwd（与原有行为一致）。
+    # 结果随 lru_cache 缓存，getcwd 只调用一次；进程内不应再 chdir
+    # （run_server.py 的 chdir 发生在导入后端之前）。
+    return os.getcwd()
+
+
+@functools.lru_cache(maxsize=1)
+def data_root() -> Path:
+    """可写数据根目录"""
+    return Path(_data_root_str())
+
+
+@functools.lru_cache(maxsize=1)
+def outputs_dir() -> Path:
+    """输出目录（Excel/CSV/ZIP 报表导出），首次访问时创建"""
+    return Path(_ensure_dir(_join(_data_root_str(), "outputs")))
+
+
+@functools.lru_cache(maxsize=1)
+def store_dir() -> Path:
+    """本地同步快照存储目录，首次访问时创建"""
+    return Path(_ensure_dir(_join(_data_root_str(), "local_sync_store")))
+
+
+@functools.lru_cache(maxsize=1)
+def snapshot_path() -> Path:
+    """本地同步快照文件路径（只计算路径，不创建目录；目录由写入方经 store_dir() 创建）"""
+    return Path(_join(_join(_data_root_str(), "local_sync_store"), "snapshot.json"))
+
+
+def clear_path_cache() -> None:
+    """
+    清空路径缓存。
+
+    LOCALAPPDATA 等环境变量在进程内被视为不变量，仅读取一次；
+    若宿主在运行期间修改了环境（如 Windows WM_SETTINGCHANGE），
+    调用本函数后下次访问会重新解析。
+    """
+    global _dirs_ensured
+    for fn in (_data_root_str, data_root, outputs_dir, store_dir, snapshot_path):
+        fn.cache_clear()
+    _created.clear()
+    _dirs_ensured = False
 
 
-DATA_ROOT: Path = _get_data_root()
+# 兼容旧的模块常量名：首次访问时才求值
+_LAZY_CONSTANTS = {
+    "DATA_ROOT": data_root,
+    "OUTPUTS_DIR": outputs_dir,
+    "STORE_DIR": store_dir,
+    "SNAPSHOT_PATH": snapshot_path,
+}
 
-# 输出目录（Excel/CSV/ZIP 报表导出）
-OUTPUTS_DIR: Path = DATA_ROOT / "outputs"
 
-# 本地同步快照存储目录
-STORE_DIR: Path = DATA_ROOT / "local_sync_store"
-SNAPSHOT_PATH: Path = STORE_DIR / "snapshot.json"
+def __getattr__(name: str) -> Any:
+    getter = _LAZY_CONSTANTS.get(name)
+    if getter is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getter()
 
 
 def ensure_dirs() -> None:
-    """启动时确保所有可写目录已创建"""
-    OUTPUTS_DIR.mkdir(parents=True, exist_ok=True)
-    STORE_DIR.mkdir(parents=True, exist_ok=True)
+    """确保所有可写目录已创建（访问函数已按需创建，此处仅为兼容保留）"""
+    global _dirs_ensured
+    if _dirs_ensured:
+        return
+    with _dirs_lock:
+        if _dirs_ensured:
+            return
+        outputs_dir()
+        store_dir()
+        _dirs_ensured = True
@@ -8,10 +8,17 @@ from __future__ import annotations
 - 基础校验与 15 分钟重采样（不做插值策略，保持保守）
 """
 
-from datetime import timedelta, datetime
+from collections import OrderedDict
+from datetime import datetime
+import functools
+import hashlib
+import json
 import logging
-from typing import Tuple, Optional, Dict, List, Any
+import pickle
+import threading
+from typing import Callable, Tuple, Optional, Dict, List, Any, Set
 
+import numpy as np
 import pandas as pd
 import os
 from pathlib import Path
@@ -32,6 +39,100 @@ class CyclesError(ValueError):
     """储能测算前置校验错误。"""
 
 
+# 解析结果缓存：同一文件 / 点数组反复提交（刷新、改参数重算）时跳过解析与重采样
+_SERIES_CACHE_SIZE = 16
+_series_cache: "OrderedDict[tuple[str, bytes], pd.DataFrame]" = OrderedDict()
+_series_cache_lock = threading.Lock()
+
+
+# 策略展开缓存：交互调参（改价格、改储能参数）时排程与日期区间不变，逐日 op/tou 与窗口掩码可复用
+_DAILY_CACHE_SIZE = 64
+_daily_cache: "OrderedDict[tuple, Any]" = OrderedDict()
+_daily_cache_lock = threading.Lock()
+
+
+def _lru_cached(cache: OrderedDict, lock: threading.Lock, maxsize: int, key: Any, build: Callable[[], Any]) -> Any:
+    """OrderedDict 实现的 LRU 查找；未命中时调用 build 并写入。返回缓存对象本身，由调用方决定是否复制。"""
+    with lock:
+        hit = cache.get(key)
+        if hit is not None:
+            cache.move_to_end(key)
+            return hit
+    value = build()
+    with lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > maxsize:
+            cache.popitem(last=False)
+    return value
+
+
+def _cached_series(key: tuple[str, bytes], build: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+    """按内容摘要缓存解析结果（LRU），返回副本以免调用方修改污染缓存。"""
+    return _lru_cached(_series_cache, _series_cache_lock, _SERIES_CACHE_SIZE, key, build).copy()
+
+
+_BIN_15MIN_NS = 15 * 60 * 10**9
+
+
+def _resample_15min_mean(values: pd.Series) -> pd.Series:
+    """按 15 分钟网格求均值（等价于 ``resample("15min").mean()``）。
+
+    values 须以已排序、去重的 DatetimeIndex 为索引；用整除得到的整数分箱号配合
+    np.bincount 求和/计数，绕开 resample 的分组调度。NaN 不计入均值，无有效点的分箱为 NaN。
+    """
+    if values.empty:
+        return values.astype(float)
+    # 分箱按纳秒整数计算，先统一为 ns 精度（秒 / 微秒精度索引的 asi8 单位不同）
+    idx = values.index.as_unit("ns")
+    bins = idx.asi8 // _BIN_15MIN_NS
+    offsets = bins - bins[0]
+    vals = values.to_numpy(dtype=float)
+    valid = ~np.isnan(vals)
+    n_bins = int(offsets[-1]) + 1
+    sums = np.bincount(offsets[valid], weights=vals[valid], minlength=n_bins)
+    counts = np.bincount(offsets[valid], minlength=n_bins)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(counts > 0, sums / counts, np.nan)
+    index = pd.date_range(
+        pd.Timestamp(int(bins[0]) * _BIN_15MIN_NS), periods=n_bins, freq="15min", name=values.index.name
+    )
+    return pd.Series(means, index=index, name=values.name)
+
+
+def _to_local_naive_timestamps(col: pd.Series) -> pd.Series:
+    """统一将带时区的时间戳转换为“本地朴素时间”，与排程的本地日界一致。
+
+    已是 datetime64 的列不再走 pd.to_datetime 的逐元素解析。
+    """
+    ts = col if pd.api.types.is_datetime64_any_dtype(col) else pd.to_datetime(col, errors="coerce")
+    try:
+        if getattr(ts.dt, "tz", None) is not None:
+            ts = ts.dt.tz_convert(TZ_NAME).dt.tz_localize(None)
+    except Exception:
+        try:
+            ts = ts.dt.tz_localize(None)
+        except Exception:
+            pass
+    return ts
+
+
+def _to_float_column(col: pd.Series) -> pd.Series:
+    """负荷列转 float64；仅 object 等非数值列才逐元素 to_numeric（非法值置 NaN）。"""
+    if pd.api.types.is_numeric_dtype(col):
+        return col.astype(np.float64, copy=False)
+    return pd.to_numeric(col, errors="coerce")
+
+
+def _sorted_unique_index(df: pd.DataFrame) -> pd.DataFrame:
+    """按索引排序并去重（保留首次）；已有序 / 无重复时跳过对应步骤（电表导出多为单调时间）。"""
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index(kind="stable")  # 稳定排序：重复时间戳保留原文件中的首条
+    if df.index.has_duplicates:
+        df = df[~df.index.duplicated(keep="first")]
+    return df
+
+
 def parse_load_series(file_bytes: bytes) -> pd.DataFrame:
     """解析负荷文件为 `timestamp, load_kw`，并重采样至 15 分钟。
 
@@ -41,7 +142,13 @@ def parse_load_series(file_bytes: bytes) -> pd.DataFrame:
     - 时间索引去重与排序
     - 按 15 分钟重采样为守约（默认取均值，不做插值）；
     - 返回 DataFrame，索引为 DatetimeIndex，含列 `load_kw`
+    - 结果按文件内容摘要缓存，相同文件重复上传不再重复解析
     """
+    digest = hashlib.blake2b(file_bytes, digest_size=16).digest()
+    return _cached_series(("file", digest), lambda: _parse_load_series(file_bytes))
+
+
+def _parse_load_series(file_bytes: bytes) -> pd.DataFrame:
     raw = loader.load_dataframe(file_bytes)
 
     # 兼容多种常见导出格式：
@@ -70,30 +177,16 @@ def parse_load_series(file_bytes: bytes) -> pd.DataFrame:
         raise CyclesError("未找到负荷列（load_kw / load / 功率(KW)）。")
 
     df = raw[["timestamp", load_col]].copy()
-    # 统一将带时区的时间戳转换为“本地朴素时间”，与排程的本地日界一致
-    ts = pd.to_datetime(df["timestamp"], errors="coerce")
-    try:
-        if getattr(ts.dt, "tz", None) is not None:
-            ts = ts.dt.tz_convert(TZ_NAME).dt.tz_localize(None)
-    except Exception:
-        try:
-            ts = ts.dt.tz_localize(None)
-        except Exception:
-            pass
-    df["timestamp"] = ts
+    df["timestamp"] = _to_local_naive_timestamps(df["timestamp"])
     df = df.dropna(subset=["timestamp"]).reset_index(drop=True)
     df.rename(columns={load_col: "load_kw"}, inplace=True)
-    df["load_kw"] = pd.to_numeric(df["load_kw"], errors="coerce")
+    df["load_kw"] = _to_float_column(df["load_kw"])
 
     # 设为索引并按时间排序，去重（保留首次）
-    df = df.set_index("timestamp").sort_index()
-    df = df[~df.index.duplicated(keep="first")]
-
-    # 重采样至 15 分钟网格（取均值），不插值
-    resampled = df.resample("15min").mean()
+    df = _sorted_unique_index(df.set_index("timestamp"))
 
-    # 返回标准化结构
-    return resampled[["load_kw"]]
+    # 重采样至 15 分钟网格（取均值），不插值；返回标准化结构
+    return _resample_15min_mean(df["load_kw"]).to_frame()
 
 
 def parse_points_series(points: List[Dict[str, Any]]) -> pd.DataFrame:
@@ -106,26 +199,26 @@ def parse_points_series(points: List[Dict[str, Any]]) -> pd.DataFrame:
     """
     if not points:
         return pd.DataFrame(index=pd.to_datetime([]), data={"load_kw": []})
+    # 仅 timestamp 与负荷值参与解析，按这两列生成摘要；
+    # 负荷列与 _parse_points_series 一致按整表确定：任一点含 load_kwh 即整表取 load_kwh，否则取 load
+    load_key = "load_kwh" if any(isinstance(p, dict) and "load_kwh" in p for p in points) else "load"
+    pairs = [
+        (p.get("timestamp"), p.get(load_key)) if isinstance(p, dict) else (p, None)
+        for p in points
+    ]
+    digest = hashlib.blake2b(pickle.dumps(pairs, protocol=4), digest_size=16).digest()
+    return _cached_series(("points", digest), lambda: _parse_points_series(points))
+
+
+def _parse_points_series(points: List[Dict[str, Any]]) -> pd.DataFrame:
     df = pd.DataFrame(points)
     # 兼容键名 load 与 load_kwh
     if "load_kwh" not in df.columns and "load" in df.columns:
         df = df.rename(columns={"load": "load_kwh"})
-    # 统一将带时区的时间戳转换为“本地朴素时间”，与排程的本地日界一致
-    ts = pd.to_datetime(df["timestamp"], errors="coerce")
-    try:
-        if getattr(ts.dt, "tz", None) is not None:
-            ts = ts.dt.tz_convert(TZ_NAME).dt.tz_localize(None)
-    except Exception:
-        try:
-            ts = ts.dt.tz_localize(None)
-        except Exception:
-            pass
-    df["timestamp"] = ts
-    df["load_kwh"] = pd.to_numeric(df["load_kwh"], errors="coerce")
-    df = df.dropna(subset=["timestamp"]).sort_values("timestamp").set_index("timestamp")
-    df = df[~df.index.duplicated(keep="first")]
-    resampled = df.resample("15min").mean()
-    return resampled.rename(columns={"load_kwh": "load_kw"})[["load_kw"]]
+    df["timestamp"] = _to_local_naive_timestamps(df["timestamp"])
+    df["load_kwh"] = _to_float_column(df["load_kwh"])
+    df = _sorted_unique_index(df.dropna(subset=["timestamp"]).set_index("timestamp"))
+    return _resample_15min_mean(df["load_kwh"]).rename("load_kw").to_frame()
 
 
 def compute_limit_info(
@@ -158,18 +251,16 @@ def compute_limit_info(
         notes.append("负荷数据为空或缺少 load_kw 列，无法统计最大需量。")
     else:
         # 确保索引为 DatetimeIndex
-        s = series_15m.copy()
-        if not isinstance(s.index, pd.DatetimeIndex):
-            s.index = pd.to_datetime(s.index, errors="coerce")
-        s = s.dropna(subset=["load_kw"])  # 去除 NaN
+        s = _with_datetime_index(series_15m).dropna(subset=["load_kw"])  # 去除 NaN
 
         # 按月统计 15 分钟点的最大值（kW）
         if not s.empty:
             month_key = s.index.strftime("%Y-%m")
             grp = s.assign(_ym=month_key).groupby("_ym")["load_kw"].max()
+            max_vals = grp.to_numpy(dtype=float)
             monthly = [
-                {"year_month": ym, "max_kw": float(val) if pd.notna(val) else 0.0}
-                for ym, val in grp.items()
+                {"year_month": ym, "max_kw": v}
+                for ym, v in zip(grp.index, np.where(np.isnan(max_vals), 0.0, max_vals).tolist())
             ]
 
     if mode == "transformer_capacity":
@@ -196,25 +287,72 @@ def compute_limit_info(
 # 策略 → 日度运行逻辑与连段（占位合并规则）
 # -------------------------
 
-def _date_range(start: datetime, end: datetime) -> List[datetime]:
-    cur = datetime(start.year, start.month, start.day)
-    days: List[datetime] = []
-    while cur.date() <= end.date():
-        days.append(cur)
-        cur += timedelta(days=1)
-    return days
+def _with_datetime_index(df: pd.DataFrame) -> pd.DataFrame:
+    """索引已是 DatetimeIndex 时原样返回；否则返回转换了索引的浅拷贝（不复制数据缓冲区）。"""
+    if isinstance(df.index, pd.DatetimeIndex):
+        return df
+    return df.set_axis(pd.to_datetime(df.index, errors="coerce"), copy=False)
+
+
+def _day_mask(index: pd.DatetimeIndex, date_str: str) -> np.ndarray:
+    """index 中落在 date_str（YYYY-MM-DD）当天的点；日期只解析一次，不逐点 strftime 比较字符串。"""
+    try:
+        day = pd.Timestamp(date_str)
+    except (ValueError, TypeError):
+        return np.zeros(len(index), dtype=bool)
+    if pd.isna(day) or day.strftime("%Y-%m-%d") != date_str:
+        return np.zeros(len(index), dtype=bool)
+    return np.asarray(index.normalize() == day)
+
+
+def _date_categories(index: pd.DatetimeIndex) -> pd.Categorical:
+    """逐点的 'YYYY-MM-DD' 日期分类（整数编码，NaT 为缺失）；只对去重后的自然日 strftime。
+
+    类别按首次出现顺序排列，index 已排序时即日期顺序；用作 groupby 键时按编码分组，不再哈希字符串。
+    """
+    codes, days = pd.factorize(index.normalize())
+    return pd.Categorical.from_codes(codes, categories=days.strftime("%Y-%m-%d"))
+
+
+def _iso_seconds(col: pd.Series) -> np.ndarray:
+    """时间列 → 'YYYY-MM-DDTHH:MM:SS' 字符串（object 数组，无法解析 / NaT 为 NaN）。
+
+    已是 datetime64 时 to_datetime 不再解析；格式化用 numpy 整列完成，替代逐点 strftime。
+    带时区时按本地墙钟时间输出（与 strftime 一致）。
+    """
+    ts = pd.DatetimeIndex(pd.to_datetime(col, errors="coerce"))
+    if ts.tz is not None:
+        ts = ts.tz_localize(None)
+    out = np.datetime_as_string(ts.to_numpy(dtype="datetime64[s]"), unit="s").astype(object)
+    nat = np.asarray(ts.isna())
+    if nat.any():
+        out[nat] = np.nan
+    return out
+
+
+def _date_range(start: datetime, end: datetime) -> pd.DatetimeIndex:
+    """[start, end] 覆盖的自然日序列（零点对齐，含首尾两天）。"""
+    return pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq="D")
+
 
+def _match_rules_by_day(days: pd.DatetimeIndex, date_rules: List[dict]) -> List[Optional[dict]]:
+    """逐日命中的日期规则（未命中为 None）。
 
-def _match_rule(d: datetime, date_rules: List[dict]) -> Optional[dict]:
-    for r in date_rules or []:
+    每条规则只解析一次，并用 searchsorted 定位其覆盖的日期区间；
+    按列表逆序写入，使多条规则重叠时仍以列表中靠前者为准。
+    """
+    matched: List[Optional[dict]] = [None] * len(days)
+    for r in reversed(date_rules or []):
         try:
             start = datetime.fromisoformat(str(r.get("startDate")) + "T00:00:00")
             end = datetime.fromisoformat(str(r.get("endDate")) + "T23:59:59")
         except Exception:
             continue
-        if start <= d <= end:
-            return r
-    return None
+        lo = int(days.searchsorted(pd.Timestamp(start), side="left"))
+        hi = int(days.searchsorted(pd.Timestamp(end), side="right"))
+        if lo < hi:
+            matched[lo:hi] = [r] * (hi - lo)
+    return matched
 
 
 def _extract_hour_ops(cell: dict) -> str:
@@ -224,43 +362,74 @@ def _extract_hour_ops(cell: dict) -> str:
     return op
 
 
-def build_daily_ops(
+def _extract_hour_tou(cell: dict) -> str:
+    tou = (cell or {}).get("tou", "平")
+    return tou if tou in _TOU_TIERS else "平"
+
+
+def _build_daily_ops_and_tou(
+    days: pd.DatetimeIndex,
+    monthly_schedule: List[List[dict]] | None,
+    date_rules: List[dict] | None,
+) -> tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+    """一次遍历日期与规则，同时取出每天 24 小时的 op 与 tou。"""
+    rules = _match_rules_by_day(days, date_rules or [])
+    daily_ops: Dict[str, List[str]] = {}
+    daily_tou: Dict[str, List[str]] = {}
+    for d, key, rule in zip(days, days.strftime("%Y-%m-%d"), rules):
+        if rule and isinstance(rule.get("schedule"), list) and len(rule["schedule"]) >= 24:
+            cells = rule["schedule"][:24]
+        else:
+            m_idx = d.month - 1
+            row = (monthly_schedule[m_idx] if (monthly_schedule and 0 <= m_idx < len(monthly_schedule)) else None) or []
+            cells = [row[h] if h < len(row) else None for h in range(24)]
+        daily_ops[key] = [_extract_hour_ops(c) for c in cells]
+        daily_tou[key] = [_extract_hour_tou(c) for c in cells]
+    return daily_ops, daily_tou
+
+
+def build_daily_ops_and_tou(
     series_15m: pd.DataFrame,
     monthly_schedule: List[List[dict]] | None,
     date_rules: List[dict] | None,
-) -> Dict[str, List[str]]:
-    """构造每一天 24 小时的运行逻辑（仅使用 op: 充/放/待机）。
+) -> tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+    """同时构造每天 24 小时的运行逻辑（op）与 TOU 档位（tou）。
 
-    优先级：命中日期规则则使用规则的 24 小时表，否则采用月度 schedule 的相应月份。
-    返回：{ 'YYYY-MM-DD': ['待机'|'充'|'放'] * 24 }
+    与分别调用 build_daily_ops / build_price_series 相比只遍历一次日期与规则；
+    返回的 daily_tou 可直接传给 build_price_series(daily_tou=...)。
+    返回：({ 'YYYY-MM-DD': [op] * 24 }, { 'YYYY-MM-DD': [tou] * 24 })
     """
     if series_15m.empty:
-        return {}
+        return {}, {}
     if not isinstance(series_15m.index, pd.DatetimeIndex):
         raise CyclesError("series_15m 索引必须是 DatetimeIndex")
 
-    start = series_15m.index.min().to_pydatetime()
-    end = series_15m.index.max().to_pydatetime()
-    days = _date_range(start, end)
+    days = _date_range(series_15m.index.min(), series_15m.index.max())
+    # 结果只取决于排程配置与日期区间（与负荷数值无关），按二者缓存
+    config = json.dumps([monthly_schedule, date_rules], sort_keys=True, ensure_ascii=False, default=str)
+    key = ("ops_tou", config, days[0].value, days[-1].value)
+    daily_ops, daily_tou = _lru_cached(
+        _daily_cache,
+        _daily_cache_lock,
+        _DAILY_CACHE_SIZE,
+        key,
+        lambda: _build_daily_ops_and_tou(days, monthly_schedule, date_rules),
+    )
+    return {k: list(v) for k, v in daily_ops.items()}, {k: list(v) for k, v in daily_tou.items()}
 
-    daily: Dict[str, List[str]] = {}
-    for d in days:
-        key = d.strftime("%Y-%m-%d")
-        rule = _match_rule(d, date_rules or [])
-        if rule and isinstance(rule.get("schedule"), list) and len(rule["schedule"]) >= 24:
-            ops = [
-                _extract_hour_ops(rule["schedule"][h])
-                for h in range(24)
-            ]
-        else:
-            m_idx = d.month - 1
-            row = (monthly_schedule[m_idx] if (monthly_schedule and 0 <= m_idx < len(monthly_schedule)) else None) or []
-            ops = [
-                _extract_hour_ops(row[h] if h < len(row) else None)
-                for h in range(24)
-            ]
-        daily[key] = ops
-    return daily
+
+def build_daily_ops(
+    series_15m: pd.DataFrame,
+    monthly_schedule: List[List[dict]] | None,
+    date_rules: List[dict] | None,
+) -> Dict[str, List[str]]:
+    """构造每一天 24 小时的运行逻辑（仅使用 op: 充/放/待机）。
+
+    优先级：命中日期规则则使用规则的 24 小时表，否则采用月度 schedule 的相应月份。
+    返回：{ 'YYYY-MM-DD': ['待机'|'充'|'放'] * 24 }
+    """
+    daily_ops, _ = build_daily_ops_and_tou(series_15m, monthly_schedule, date_rules)
+    return daily_ops
 
 
 def _merge_head_tail_runs(runs: List[tuple[str, List[int]]], enabled: bool = False) -> List[tuple[str, List[int]]]:
@@ -318,11 +487,39 @@ def build_daily_cycles_masks(
     返回：(masks_by_date, merged_count)
       masks_by_date: {
         'YYYY-MM-DD': {
-            'c1': { 'charge_hours': [...], 'discharge_hours': [...] },
-            'c2': { 'charge_hours': [...], 'discharge_hours': [...] },
+            'c1': { 'charge_hours': [...], 'discharge_hours': [...], 'charge_mask': ndarray, 'discharge_mask': ndarray },
+            'c2': { ... 同 c1 ... },
         }
       }
+      *_hours 为升序小时列表（供调试/导出展示）；*_mask 为长度 24 的 bool 数组，
+      供窗口计算直接以 mask[小时数组] 选点。
     """
+    key = (
+        "masks",
+        tuple((d, tuple(ops)) for d, ops in daily_ops.items()),
+        merge_threshold_minutes,
+        bool(wrap_across_midnight),
+    )
+    masks, merged_total, runs_debug = _lru_cached(
+        _daily_cache,
+        _daily_cache_lock,
+        _DAILY_CACHE_SIZE,
+        key,
+        lambda: _build_daily_cycles_masks(daily_ops, merge_threshold_minutes, wrap_across_midnight),
+    )
+    # 返回副本以免调用方修改污染缓存
+    masks_copy = {
+        d: {w: {f: v.copy() for f, v in entry.items()} for w, entry in by_win.items()}
+        for d, by_win in masks.items()
+    }
+    return masks_copy, merged_total, [dict(row) for row in runs_debug]
+
+
+def _build_daily_cycles_masks(
+    daily_ops: Dict[str, List[str]],
+    merge_threshold_minutes: int,
+    wrap_across_midnight: bool,
+) -> tuple[Dict[str, dict], int, List[dict]]:
     masks: Dict[str, dict] = {}
     merged_total = 0
     runs_debug: List[dict] = []
@@ -330,10 +527,11 @@ def build_daily_cycles_masks(
         runs_pre = _hour_runs_from_ops(ops, wrap_across_midnight=wrap_across_midnight)
         # 过滤小片段（按分钟阈值）
         runs_flt = []
+        day_debug: List[dict] = []  # 当日调试行，下标即 seq
         for i, (k, hrs) in enumerate(runs_pre):
             length_min = len(hrs) * 60
             filtered = length_min < (merge_threshold_minutes or 0)
-            runs_debug.append({
+            day_debug.append({
                 "date": key,
                 "seq": i,
                 "kind": k,
@@ -346,6 +544,7 @@ def build_daily_cycles_masks(
             })
             if not filtered:
                 runs_flt.append((k, hrs))
+        runs_debug.extend(day_debug)
 
         c1 = {"charge_hours": set(), "discharge_hours": set()}
         c2 = {"charge_hours": set(), "discharge_hours": set()}
@@ -357,17 +556,52 @@ def build_daily_cycles_masks(
                 target["charge_hours"].update(hrs)
             elif k == "放":
                 target["discharge_hours"].update(hrs)
-            # 标注合并目标
-            for dbg in runs_debug:
-                if dbg["date"] == key and dbg["seq"] == i and not dbg["filtered_by_threshold"]:
-                    dbg["merged_to"] = "c1" if i < 2 else "c2"
+            # 标注合并目标（只需查当日调试行，不再扫描全年）
+            if i < len(day_debug) and not day_debug[i]["filtered_by_threshold"]:
+                day_debug[i]["merged_to"] = "c1" if i < 2 else "c2"
         masks[key] = {
-            "c1": {"charge_hours": sorted(c1["charge_hours"]), "discharge_hours": sorted(c1["discharge_hours"])},
-            "c2": {"charge_hours": sorted(c2["charge_hours"]), "discharge_hours": sorted(c2["discharge_hours"])},
+            "c1": _window_hours_entry(c1["charge_hours"], c1["discharge_hours"]),
+            "c2": _window_hours_entry(c2["charge_hours"], c2["discharge_hours"]),
         }
     return masks, merged_total, runs_debug
 
 
+def _hours_mask(hours) -> np.ndarray:
+    """小时集合 -> 长度 24 的 bool 掩码（越界小时忽略）。"""
+    mask = np.zeros(24, dtype=bool)
+    hrs = np.fromiter((int(h) for h in (hours or [])), dtype=np.int64)
+    mask[hrs[(hrs >= 0) & (hrs < 24)]] = True
+    return mask
+
+
+def _window_hours_entry(charge_hours: Set[int], discharge_hours: Set[int]) -> dict:
+    return {
+        "charge_hours": sorted(charge_hours),
+        "discharge_hours": sorted(discharge_hours),
+        "charge_mask": _hours_mask(charge_hours),
+        "discharge_mask": _hours_mask(discharge_hours),
+    }
+
+
+def _window_mask(cmask: dict, kind: str) -> np.ndarray:
+    """取窗口的 24 小时 bool 掩码；手工构造、仅含小时列表的 masks 现场转换。"""
+    mask = cmask.get(f"{kind}_mask")
+    if mask is None:
+        mask = _hours_mask(cmask.get(f"{kind}_hours"))
+    return mask
+
+
+# TOU 档位（顺序即价格表列序）
+_TOU_TIERS = ("尖", "峰", "平", "谷", "深")
+
+_NS_PER_DAY = 24 * 3600 * 10**9
+
+
+def _day_offsets(idx: pd.DatetimeIndex, day0: pd.Timestamp) -> np.ndarray:
+    """idx 各点所在日相对 day0（零点）的整日偏移；先统一为 ns 精度，与索引的 s/ms/us 精度无关。"""
+    return (idx.normalize().as_unit("ns").asi8 - pd.Timestamp(day0).as_unit("ns").value) // _NS_PER_DAY
+
+
 def count_missing_prices(monthly_prices: List[dict] | None) -> tuple[int, List[int]]:
     """统计月度 TOU 价格缺失项数量。
 
@@ -376,21 +610,13 @@ def count_missing_prices(monthly_prices: List[dict] | None) -> tuple[int, List[i
     """
     if not monthly_prices:
         return 0, []
-    missing = 0
-    bad_months: List[int] = []
-    for i, mp in enumerate(monthly_prices):
-        if not isinstance(mp, dict):
-            bad_months.append(i)
-            continue
-        for tier in ("尖", "峰", "平", "谷", "深"):
-            v = mp.get(tier)
-            if v is None:
-                missing += 1
-            else:
-                try:
-                    float(v)
-                except Exception:
-                    missing += 1
+    bad_months = [i for i, mp in enumerate(monthly_prices) if not isinstance(mp, dict)]
+    valid = [mp for mp in monthly_prices if isinstance(mp, dict)]
+    if not valid:
+        return 0, bad_months
+    # 一次性转为 (月 × 档位) 表，整体 to_numeric 后统计 NaN（None/无法解析/NaN 均计为缺失）
+    df = pd.DataFrame.from_records(valid, columns=list(_TOU_TIERS)).astype(object)
+    missing = int(pd.to_numeric(pd.Series(df.to_numpy().ravel()), errors="coerce").isna().sum())
     return missing, bad_months
 
 
@@ -399,75 +625,59 @@ def build_price_series(
     monthly_schedule: List[List[dict]] | None,
     date_rules: List[dict] | None,
     monthly_prices: List[dict] | None,
+    daily_tou: Dict[str, List[str]] | None = None,
 ) -> tuple[pd.DataFrame, int]:
     """将 TOU 档位映射到 15 分钟点位并附上价格。
 
+    daily_tou: 可选，build_daily_ops_and_tou 已构造的逐日档位，传入时不再重复遍历规则。
+
     返回：(df, missing_points)
-    - df: 与 series_15m 同索引，列 `tier` 和 `price`
+    - df: 与 series_15m 同索引，列 `tier`（Categorical，类别即五档）和 `price`
     - missing_points: price 为 None/NaN 的 15 分钟点位计数
     """
     if series_15m.empty:
         return pd.DataFrame(index=series_15m.index, data={"tier": [], "price": []}), 0
-    if not isinstance(series_15m.index, pd.DatetimeIndex):
-        s = series_15m.copy()
-        s.index = pd.to_datetime(s.index, errors="coerce")
-        s = s.dropna()
-    else:
-        s = series_15m
+    s = series_15m
+    if not isinstance(s.index, pd.DatetimeIndex):
+        s = _with_datetime_index(s).dropna()
 
-    # 预构造每日 24 小时档位
-    # 复用 daily_ops，但保留 tou 字段
-    def _extract_hour_tou(cell: dict) -> str:
-        tou = (cell or {}).get("tou", "平")
-        return tou if tou in ("尖", "峰", "平", "谷", "深") else "平"
+    # 预构造每日 24 小时档位（调用方已构造时直接复用）
+    days = _date_range(s.index.min(), s.index.max())
+    if daily_tou is None:
+        _, daily_tou = _build_daily_ops_and_tou(days, monthly_schedule, date_rules)
 
-    start = s.index.min().to_pydatetime()
-    end = s.index.max().to_pydatetime()
-    days = _date_range(start, end)
-    daily_tou: Dict[str, List[str]] = {}
-    for d in days:
-        key = d.strftime("%Y-%m-%d")
-        rule = _match_rule(d, date_rules or [])
-        if rule and isinstance(rule.get("schedule"), list) and len(rule["schedule"]) >= 24:
-            tiers = [
-                _extract_hour_tou(rule["schedule"][h])
-                for h in range(24)
-            ]
-        else:
-            m_idx = d.month - 1
-            row = (monthly_schedule[m_idx] if (monthly_schedule and 0 <= m_idx < len(monthly_schedule)) else None) or []
-            tiers = [
-                _extract_hour_tou(row[h] if h < len(row) else None)
-                for h in range(24)
-            ]
-        daily_tou[key] = tiers
-
-    # 月度价格映射
-    def _price_for(month_idx: int, tier: str) -> Optional[float]:
-        if not monthly_prices or not (0 <= month_idx < len(monthly_prices)):
-            return None
-        pm = monthly_prices[month_idx]
-        try:
+    # 月度价格表：price_table[month_idx, tier_idx]，缺失/非法值为 NaN
+    price_table = np.full((12, len(_TOU_TIERS)), np.nan)
+    for m_idx, pm in enumerate((monthly_prices or [])[:12]):
+        if not isinstance(pm, dict):
+            continue
+        for t_idx, tier in enumerate(_TOU_TIERS):
             v = pm.get(tier)
-            return float(v) if v is not None else None
-        except Exception:
-            return None
-
-    records: List[dict] = []
-    missing_points = 0
-    for ts in s.index:
-        day_key = ts.strftime("%Y-%m-%d")
-        hour = ts.hour
-        tiers = daily_tou.get(day_key)
-        tier = tiers[hour] if tiers and 0 <= hour < len(tiers) else "平"
-        month_idx = ts.month - 1
-        price = _price_for(month_idx, tier)
-        if price is None or not pd.notna(price):
-            missing_points += 1
-        records.append({"timestamp": ts, "tier": tier, "price": price})
-
-    df = pd.DataFrame.from_records(records).set_index("timestamp").sort_index()
-    return df, int(missing_points)
+            try:
+                price_table[m_idx, t_idx] = float(v) if v is not None else np.nan
+            except Exception:
+                pass
+
+    # 每日 24 小时档位编码表：tier_table[day_idx, hour]
+    tier_pos = {t: i for i, t in enumerate(_TOU_TIERS)}
+    flat = tier_pos["平"]
+    rows: List[List[int]] = []
+    for key in days.strftime("%Y-%m-%d"):
+        tiers = (daily_tou.get(key) or [])[:24]
+        rows.append([tier_pos.get(t, flat) for t in tiers] + [flat] * (24 - len(tiers)))
+    tier_table = np.array(rows, dtype=np.int8)
+
+    idx = s.index
+    day_idx = _day_offsets(idx, days[0])
+    tier_codes = tier_table[day_idx, idx.hour.to_numpy()]
+    prices = price_table[idx.month.to_numpy() - 1, tier_codes]
+    missing_points = int(np.isnan(prices).sum())
+
+    df = pd.DataFrame(
+        {"tier": pd.Categorical.from_codes(tier_codes, categories=list(_TOU_TIERS)), "price": prices},
+        index=idx.rename("timestamp"),
+    ).sort_index()
+    return df, missing_points
 
 
 # -------------------------
@@ -492,29 +702,24 @@ def compute_tip_discharge_summary(
     if series_15m.empty or price_series.empty:
         logger.debug("[tip_summary] empty series or price_series")
         return None
-    s = series_15m.copy()
-    p = price_series.copy()
-    if not isinstance(s.index, pd.DatetimeIndex):
-        s.index = pd.to_datetime(s.index, errors="coerce")
-    if not isinstance(p.index, pd.DatetimeIndex):
-        p.index = pd.to_datetime(p.index, errors="coerce")
-    s = s.dropna(subset=["load_kw"]).sort_index()
-    p = p.dropna(subset=["tier"]).sort_index()
+    s = _with_datetime_index(series_15m).dropna(subset=["load_kw"]).sort_index()
+    p = _with_datetime_index(price_series).dropna(subset=["tier"]).sort_index()
     if s.empty or p.empty:
         return None
 
     df = s.join(p[["tier"]], how="inner")
 
-    def _op_for_ts(ts: pd.Timestamp) -> Optional[str]:
-        day_key = ts.strftime("%Y-%m-%d")
-        ops = daily_ops.get(day_key)
-        if not ops:
-            return None
-        h = ts.hour
-        return ops[h] if 0 <= h < len(ops) else None
-
-    df["op"] = [ _op_for_ts(ts) for ts in df.index ]
-    df_tip = df[(df["tier"] == "尖") & (df["op"] == "放")]
+    # 逐日 24 小时“是否放电”表：discharge_table[day_idx, hour]，按 (日, 小时) 直接索引
+    idx = df.index
+    days = _date_range(idx.min(), idx.max())
+    rows: List[List[bool]] = []
+    for key in days.strftime("%Y-%m-%d"):
+        ops = (daily_ops.get(key) or [])[:24]
+        rows.append([op == "放" for op in ops] + [False] * (24 - len(ops)))
+    discharge_table = np.array(rows, dtype=bool).reshape(len(days), 24)
+    day_idx = _day_offsets(idx, days[0])
+    is_discharge = discharge_table[day_idx, idx.hour.to_numpy()]
+    df_tip = df[(df["tier"] == "尖").to_numpy() & is_discharge]
     if df_tip.empty:
         logger.info("[tip_summary] no尖放点: total_points=%s tip_points=0", len(df))
         cap = float(storage_cfg.get("capacity_kwh", 0) or 0)
@@ -529,23 +734,26 @@ def compute_tip_discharge_summary(
           "note": "无 TOU=尖 且运行逻辑=放 的 15 分钟点，尖放电占比记为 0",
         }
 
-    day_keys = sorted(set(df_tip.index.date))
+    # 一次 groupby 得到逐日均值 / 点数 / 尖放小时集合，避免逐日全表扫描
+    tip_day = df_tip.index.normalize()
+    grp = df_tip["load_kw"].groupby(tip_day)
+    avg_per_day = grp.mean()
+    points_per_day = grp.size()
+    hours_per_day = pd.Series(df_tip.index.hour, index=tip_day).groupby(level=0).unique()
+    day_keys = list(avg_per_day.index)
     cap = float(storage_cfg.get("capacity_kwh", 0) or 0)
 
     day_stats: List[dict] = []
-    for dk in day_keys:
-        day_str = pd.Timestamp(dk).strftime("%Y-%m-%d")
-        day_sub = df_tip.loc[df_tip.index.date == dk]
-        avg_day = float(day_sub["load_kw"].mean()) if not day_sub.empty else 0.0
-        tip_hours_day = float(len(day_sub) * 0.25)
+    for dk, day_str in zip(day_keys, avg_per_day.index.strftime("%Y-%m-%d")):
+        avg_day = float(avg_per_day.at[dk])
+        tip_hours_day = float(int(points_per_day.at[dk]) * 0.25)
         energy_day = avg_day * tip_hours_day
 
-        tip_hour_set = set(day_sub.index.hour)
+        tip_hours_arr = np.asarray(hours_per_day.at[dk], dtype=np.int64)
         masks = (daily_masks or {}).get(day_str, {})
         cnt = 0
         for win in ("c1", "c2"):
-            hours = masks.get(win, {}).get("discharge_hours", []) or []
-            if set(int(h) for h in hours) & tip_hour_set:
+            if _window_mask(masks.get(win, {}), "discharge")[tip_hours_arr].any():
                 cnt += 1
         discharge_count_day = float(cnt)
         if discharge_count_day <= 0 or cap <= 0 or tip_hours_day <= 0:
@@ -590,11 +798,14 @@ def compute_tip_discharge_summary(
             month_stats.append({"month": m, "ratio": float(sum(arr) / len(arr)) if arr else 0.0})
 
     # 尖段点位列表（仅时间与负荷，避免返回过大文本）
-    # 裁剪点位，避免体积过大
+    # 先裁剪到前 200 点再格式化，避免体积过大
+    head = df_tip["load_kw"].head(200)
+    head_vals = head.to_numpy(dtype=float)
+    head_vals = np.where(np.isnan(head_vals), 0.0, head_vals)
     tip_points = [
-        {"time": ts.strftime("%Y-%m-%d %H:%M"), "load_kw": float(val) if pd.notna(val) else 0.0}
-        for ts, val in df_tip["load_kw"].items()
-    ][:200]
+        {"time": t, "load_kw": v}
+        for t, v in zip(head.index.strftime("%Y-%m-%d %H:%M"), head_vals.tolist())
+    ]
 
     note = (
         f"基于 TOU=尖 且运行逻辑=放 的 15 分钟点，共 {len(df_tip)} 点，{len(day_keys)} 天；"
@@ -637,26 +848,102 @@ def _build_hourly_average(series_15m: pd.DataFrame) -> Dict[str, List[float]]:
     """
     if series_15m.empty:
         return {}
-    s = series_15m.copy()
-    if not isinstance(s.index, pd.DatetimeIndex):
-        s.index = pd.to_datetime(s.index, errors="coerce")
-    s = s.dropna(subset=["load_kw"]).sort_index()
+    s = _with_datetime_index(series_15m).dropna(subset=["load_kw"]).sort_index()
     # 每小时平均
     hourly = s["load_kw"].resample("1H").mean()
-    by_day: Dict[str, List[float]] = {}
-    # 遍历小时序列并按天收集
-    for ts, val in hourly.items():
-        key = ts.strftime("%Y-%m-%d")
-        if key not in by_day:
-            by_day[key] = [0.0] * 24
-        by_day[key][ts.hour] = float(val) if pd.notna(val) else 0.0
-    return by_day
+    if hourly.empty:
+        return {}
+    # 按 (日, 小时) 写入二维表，缺失/NaN 记 0，再按天转为列表
+    idx = hourly.index
+    days = _date_range(idx[0], idx[-1])
+    table = np.zeros((len(days), 24))
+    day_idx = _day_offsets(idx, days[0])
+    vals = hourly.to_numpy(dtype=float)
+    table[day_idx, idx.hour.to_numpy()] = np.where(np.isnan(vals), 0.0, vals)
+    return dict(zip(days.strftime("%Y-%m-%d"), table.tolist()))
+
+
+def _month_limits_kw(limit_info: Dict, months) -> Dict[str, float]:
+    """各月（YYYY-MM）的窗口平均上限（kW）：变压器口径取固定上限，否则取当月最大需量（缺失为 0）。"""
+    month_max_map: Dict[str, float] = {
+        it.get("year_month"): float(it.get("max_kw", 0) or 0)
+        for it in (limit_info.get("monthly_demand_max") or [])
+    }
+    transformer_limit_kw = limit_info.get("transformer_limit_kw")
+    if limit_info.get("limit_mode", "monthly_demand_max") == "transformer_capacity" and transformer_limit_kw:
+        return {ym: float(transformer_limit_kw) for ym in months}
+    return {ym: float(month_max_map.get(ym, 0.0)) for ym in months}
+
+
+def _day_bounds(index: pd.DatetimeIndex, date_strs: List[str]) -> tuple[np.ndarray, np.ndarray]:
+    """已排序、无 NaT 的 index 中各日（YYYY-MM-DD）点位的 [lo, hi) 位置区间；无法解析的日期区间为空。"""
+    starts = pd.to_datetime(pd.Index(date_strs, dtype=object), format="%Y-%m-%d", errors="coerce")
+    valid = ~starts.isna()
+    # 与纳秒常量混用，index / starts 均先统一为 ns 精度
+    ts = index.as_unit("ns").asi8
+    lo = np.zeros(len(date_strs), dtype=np.int64)
+    hi = np.zeros(len(date_strs), dtype=np.int64)
+    start_ns = starts.as_unit("ns").asi8[valid]
+    lo[valid] = np.searchsorted(ts, start_ns, side="left")
+    hi[valid] = np.searchsorted(ts, start_ns + _NS_PER_DAY, side="left")
+    return lo, hi
 
 
 def _month_key_of_date_str(date_str: str) -> str:
     return date_str[:7]
 
 
+# 每日两次循环的窗口顺序：(c1 充, c1 放, c2 充, c2 放)
+_CYCLE_WINDOWS = (("c1", "charge"), ("c1", "discharge"), ("c2", "charge"), ("c2", "discharge"))
+_CYCLE_IS_CHARGE = np.array([kind == "charge" for _, kind in _CYCLE_WINDOWS])
+
+
+@functools.lru_cache(maxsize=256)
+def _fmt_hours(hours: tuple) -> str:
+    """小时元组 → 调试行的 hour_list 字符串；全年只有少数几种窗口组合，按元组缓存。"""
+    return ",".join(str(int(h)) for h in hours)
+
+
+def _window_lut(masks: dict) -> np.ndarray:
+    """当日四个窗口的小时查找表，形状 (4, 24)，行序同 _CYCLE_WINDOWS；lut[:, hours] 即各窗口选点矩阵。"""
+    return np.stack([_window_mask(masks.get(win, {}), kind) for win, kind in _CYCLE_WINDOWS])
+
+
+def _window_avg_cycles(
+    win_avg: np.ndarray,
+    win_points: np.ndarray,
+    limits: np.ndarray,
+    reserve_ch: float,
+    reserve_dis: float,
+    cap: float,
+    dod: float,
+    eta: float,
+    energy_formula: str,
+) -> np.ndarray:
+    """窗口平均法的逐日次数（向量化）。
+
+    win_avg / win_points: 形状 (天, 4)，列序同 _CYCLE_WINDOWS，为各窗口平均负荷与点数；
+    limits: 逐日上限（kW）。上限 <= 0 的天次数为 0。
+    """
+    hours = win_points * 0.25
+    is_charge = _CYCLE_IS_CHARGE
+    allow = np.where(
+        is_charge,
+        limits[:, None] - reserve_ch - win_avg,
+        win_avg - reserve_dis,
+    )
+    base = np.where(win_points > 0, np.maximum(0.0, allow) * hours, 0.0)
+
+    if energy_formula == "physics":
+        e_grid = np.where(is_charge, base * dod / max(eta, 1e-9), base * dod * eta)
+    else:
+        e_grid = np.where(is_charge, base / max(dod, 1e-9) * eta, base / max(dod, 1e-9) / max(eta, 1e-9))
+
+    full = np.minimum(e_grid / cap, 1.0)
+    cycles = np.minimum(full[:, 0], full[:, 1]) + np.minimum(full[:, 2], full[:, 3])
+    return np.where(limits > 0, cycles, 0.0)
+
+
 def compute_window_avg_days(
     series_15m: pd.DataFrame,
     daily_masks: Dict[str, dict],
@@ -684,90 +971,62 @@ def compute_window_avg_days(
     reserve_ch = float(storage_cfg.get("reserve_charge_kw", 0) or 0)
     reserve_dis = float(storage_cfg.get("reserve_discharge_kw", 0) or 0)
 
-    # 月份→最大需量映射
-    month_max_map: Dict[str, float] = {it.get("year_month"): float(it.get("max_kw", 0) or 0) for it in (limit_info.get("monthly_demand_max") or [])}
-    transformer_limit_kw = limit_info.get("transformer_limit_kw")
-    mode = limit_info.get("limit_mode", "monthly_demand_max")
+    # 月份→上限（kW），每个月只解析一次
+    month_limit = _month_limits_kw(limit_info, {_month_key_of_date_str(d) for d in daily_masks})
 
     if series_15m.empty:
         return []
-    s = series_15m.copy()
-    if not isinstance(s.index, pd.DatetimeIndex):
-        s.index = pd.to_datetime(s.index, errors="coerce")
-    s = s.dropna(subset=["load_kw"]).sort_index()
+    s = _with_datetime_index(series_15m).dropna(subset=["load_kw"]).sort_index()
+    if s.index.hasnans:
+        s = s[s.index.notna()]
+    s_hour = s.index.hour.to_numpy()
+    s_load = s["load_kw"].to_numpy()
+    # 各日点位在已排序序列中的 [lo, hi) 偏移（searchsorted 一次求出）
+    day_lo, day_hi = _day_bounds(s.index, list(daily_masks))
+    # 逐日只做选点与求均值，收集成 (天, 窗口) 数组；能量折算与次数在循环外一次向量化完成
+    n_days = len(daily_masks)
+    limits = np.zeros(n_days)
+    win_avg = np.zeros((n_days, len(_CYCLE_WINDOWS)))
+    win_points = np.zeros((n_days, len(_CYCLE_WINDOWS)))
     days: List[dict] = []
-    for date_str, masks in daily_masks.items():
-        ym = _month_key_of_date_str(date_str)
-        if mode == "transformer_capacity" and transformer_limit_kw:
-            limit_kw = float(transformer_limit_kw)
-        else:
-            limit_kw = float(month_max_map.get(ym, 0.0))
+    for i, ((date_str, masks), lo, hi) in enumerate(zip(daily_masks.items(), day_lo.tolist(), day_hi.tolist())):
+        limit_kw = month_limit[_month_key_of_date_str(date_str)]
+        limits[i] = limit_kw
 
         # 当天的 15 分钟序列
-        day_start = pd.to_datetime(date_str)
-        day_end = day_start + pd.Timedelta(days=1)
-        day_sub = s.loc[(s.index >= day_start) & (s.index < day_end)]
+        day_hours = s_hour[lo:hi]
+        day_load = s_load[lo:hi]
 
         # 判断该天数据是否有效：
         # 1. 有数据点（point_count > 0）
         # 2. 至少有一个正数负荷值（has_positive_load）
-        point_count = len(day_sub)
-        has_positive_load = bool((day_sub["load_kw"] > 0).any()) if point_count > 0 else False
+        point_count = hi - lo
+        has_positive_load = bool((day_load > 0).any()) if point_count > 0 else False
         is_valid = point_count > 0 and has_positive_load
-
-        # 无上限或容量→无法计算 cycles
-        if limit_kw <= 0 or cap <= 0:
-            days.append({
-                "date": date_str,
-                "cycles": 0.0,
-                "is_valid": is_valid,
-                "point_count": point_count,
-            })
-            continue
-
-        c1 = masks.get("c1", {})
-        c2 = masks.get("c2", {})
-
-        def _window_energy(hour_list: List[int], is_charge: bool) -> float:
-            if not hour_list:
-                return 0.0
-            hour_set = set(int(h) for h in hour_list)
-            # 选中该窗口的 15 分钟点
-            sel = day_sub.loc[day_sub.index.hour.map(lambda h: h in hour_set)]
-            if sel.empty:
-                return 0.0
-            avg_load = float(sel["load_kw"].mean())
-            hours = float(len(sel)) * 0.25
-            if is_charge:
-                allow = limit_kw - reserve_ch - avg_load
-            else:
-                allow = avg_load - reserve_dis
-            allow = max(0.0, allow)
-            return allow * hours
-
-        def _cycle_contrib(cmask: dict) -> float:
-            e_in_base = _window_energy(cmask.get("charge_hours", []), True)
-            e_out_base = _window_energy(cmask.get("discharge_hours", []), False)
-
-            if energy_formula == "physics":
-                E_in_grid = e_in_base * dod / max(eta, 1e-9)
-                E_out_grid = e_out_base * dod * eta
-            else:
-                E_in_grid = e_in_base / max(dod, 1e-9) * eta
-                E_out_grid = e_out_base / max(dod, 1e-9) / max(eta, 1e-9)
-
-            fc = min(E_in_grid / cap if cap > 0 else 0.0, 1.0)
-            fd = min(E_out_grid / cap if cap > 0 else 0.0, 1.0)
-            return min(fc, fd)
-
-        cycles_day = _cycle_contrib(c1) + _cycle_contrib(c2)
         days.append({
             "date": date_str,
-            "cycles": float(cycles_day),
+            "cycles": 0.0,
             "is_valid": is_valid,
             "point_count": point_count,
         })
 
+        # 无数据点、无上限或容量→无法计算 cycles（保持 0），跳过选点
+        if point_count == 0 or limit_kw <= 0 or cap <= 0:
+            continue
+
+        # 选中各窗口的 15 分钟点：查 24 小时 LUT 得到 (4, 点数) 选择矩阵
+        sel = _window_lut(masks)[:, day_hours]
+        n = sel.sum(axis=1)
+        win_points[i] = n
+        win_avg[i] = np.divide(sel @ day_load, n, out=np.zeros(len(n)), where=n > 0)
+
+    if cap > 0:
+        cycles = _window_avg_cycles(
+            win_avg, win_points, limits, reserve_ch, reserve_dis, cap, dod, eta, energy_formula
+        )
+        for day, c in zip(days, cycles.tolist()):
+            day["cycles"] = c
+
     # 按日期排序
     days.sort(key=lambda x: x["date"])
     return days
@@ -779,7 +1038,8 @@ def compute_window_avg_days_with_debug(
     storage_cfg: Dict,
     limit_info: Dict,
     energy_formula: str = "physics",
-) -> tuple[List[dict], List[dict]]:
+    debug: bool = True,
+) -> tuple[List[dict], Optional[List[dict]]]:
     """同 compute_window_avg_days，但额外返回“窗口汇总明细”行，用于 Excel 调试。
 
     返回：(
@@ -788,7 +1048,10 @@ def compute_window_avg_days_with_debug(
         {date, window, kind, hour_list, points, avg_load_kw, hours, limit_kw, allow_kw, base_kwh, e_grid_kwh, full_ratio}
       ]
     )
+    debug=False 时不构造明细行（window_debug 返回 None），只计算逐日次数。
     """
+    if not debug:
+        return compute_window_avg_days(series_15m, daily_masks, storage_cfg, limit_info, energy_formula), None
 
     # 复用已对齐窗口平均法的实现，增加调试行收集
     cap = float(storage_cfg.get("capacity_kwh", 0) or 0)
@@ -797,168 +1060,174 @@ def compute_window_avg_days_with_debug(
     reserve_ch = float(storage_cfg.get("reserve_charge_kw", 0) or 0)
     reserve_dis = float(storage_cfg.get("reserve_discharge_kw", 0) or 0)
 
-    # 月份→最大需量映射
-    month_max_map: Dict[str, float] = {it.get("year_month"): float(it.get("max_kw", 0) or 0) for it in (limit_info.get("monthly_demand_max") or [])}
-    transformer_limit_kw = limit_info.get("transformer_limit_kw")
-    mode = limit_info.get("limit_mode", "monthly_demand_max")
+    # 月份→上限（kW），每个月只解析一次
+    month_limit = _month_limits_kw(limit_info, {_month_key_of_date_str(d) for d in daily_masks})
 
     if series_15m.empty:
         return [], []
-    s = series_15m.copy()
-    if not isinstance(s.index, pd.DatetimeIndex):
-        s.index = pd.to_datetime(s.index, errors="coerce")
-    s = s.dropna(subset=["load_kw"]).sort_index()
-
-    def _day_limit_kw(ym: str) -> float:
-        if mode == "transformer_capacity" and transformer_limit_kw:
-            return float(transformer_limit_kw)
-        return float(month_max_map.get(ym, 0.0))
-
-    def _window_metrics(day_sub: pd.DataFrame, hour_list: List[int], limit_kw: float, is_charge: bool) -> tuple[dict, float, float]:
-        hour_set = set(int(h) for h in (hour_list or []))
-        sel = day_sub.loc[day_sub.index.hour.map(lambda h: h in hour_set)]
-        points = int(len(sel))
-        if points == 0:
-            return {
-                "points": 0,
-                "avg_load_kw": 0.0,
-                "hours": 0.0,
-                "allow_kw": 0.0,
-                "base_kwh": 0.0,
-                "e_grid_kwh": 0.0,
-                "full_ratio": 0.0,
-                # 对照：逐点积分（step_15）
-                "base_kwh_step15": 0.0,
-                "e_grid_kwh_step15": 0.0,
-                "full_ratio_step15": 0.0,
-            }, 0.0, 0.0
-        avg_load = float(sel["load_kw"].mean())
-        hours = float(points) * 0.25
-        allow = max(0.0, (limit_kw - reserve_ch - avg_load) if is_charge else (avg_load - reserve_dis))
-        base_kwh = allow * hours
-        # 两套口径同时计算（用于对拍）：physics 与 sample
-        e_grid_physics = (base_kwh * dod / max(eta, 1e-9)) if is_charge else (base_kwh * dod * eta)
-        e_grid_sample  = (base_kwh / max(dod, 1e-9) * eta) if is_charge else (base_kwh / max(dod, 1e-9) / max(eta, 1e-9))
-        full_ratio_physics = min(e_grid_physics / cap if cap > 0 else 0.0, 1.0)
-        full_ratio_sample  = min(e_grid_sample  / cap if cap > 0 else 0.0, 1.0)
-
-        # 维持原有字段（随 energy_formula 切换），但同时返回两套对拍列
-        if energy_formula == "physics":
-            e_grid = e_grid_physics
-            full_ratio = full_ratio_physics
-        else:
-            e_grid = e_grid_sample
-            full_ratio = full_ratio_sample
-
-        # 附加对照：逐 15 分钟积分（step_15，不改变主口径，仅用于报表对拍）
-        if is_charge:
-            allow_series = (limit_kw - reserve_ch - sel["load_kw"]).clip(lower=0.0)
-            base_step15 = float((allow_series * 0.25).sum())
-            e_grid_physics_step15 = base_step15 * (dod / max(eta, 1e-9))
-            e_grid_sample_step15  = base_step15 * (eta / max(dod, 1e-9))
-        else:
-            allow_series = (sel["load_kw"] - reserve_dis).clip(lower=0.0)
-            base_step15 = float((allow_series * 0.25).sum())
-            e_grid_physics_step15 = base_step15 * (dod * eta)
-            e_grid_sample_step15  = base_step15 * (1.0 / max(dod * eta, 1e-9))
-        full_ratio_physics_step15 = min(e_grid_physics_step15 / cap if cap > 0 else 0.0, 1.0)
-        full_ratio_sample_step15  = min(e_grid_sample_step15  / cap if cap > 0 else 0.0, 1.0)
-
-        return {
-            "points": points,
-            "avg_load_kw": avg_load,
-            "hours": hours,
-            "allow_kw": allow,
-            "base_kwh": base_kwh,
-            # 主口径当前值（随 energy_formula 切换）
-            "e_grid_kwh": e_grid,
-            "full_ratio": full_ratio,
-            # physics 与 sample 两套对拍（窗口平均）
-            "e_grid_kwh_physics": e_grid_physics,
-            "full_ratio_physics": full_ratio_physics,
-            "e_grid_kwh_sample": e_grid_sample,
-            "full_ratio_sample": full_ratio_sample,
-            # 逐点积分对照（step_15）
-            "base_kwh_step15": base_step15,
-            "e_grid_kwh_physics_step15": e_grid_physics_step15,
-            "full_ratio_physics_step15": full_ratio_physics_step15,
-            "e_grid_kwh_sample_step15": e_grid_sample_step15,
-            "full_ratio_sample_step15": full_ratio_sample_step15,
-        }, full_ratio, e_grid
-
-    days: List[dict] = []
-    debug_rows: List[dict] = []
-    for date_str, masks in sorted(daily_masks.items(), key=lambda kv: kv[0]):
-        ym = date_str[:7]
-        limit_kw = _day_limit_kw(ym)
-        day_start = pd.to_datetime(date_str)
-        day_end = day_start + pd.Timedelta(days=1)
-        day_sub = s.loc[(s.index >= day_start) & (s.index < day_end)]
+    s = _with_datetime_index(series_15m).dropna(subset=["load_kw"]).sort_index()
+    if s.index.hasnans:
+        s = s[s.index.notna()]
+    # 小时与负荷整列只解码一次，逐日按 [lo, hi) 偏移切片
+    s_hour = s.index.hour.to_numpy()
+    s_load = s["load_kw"].to_numpy()
+
+    # 电池侧能量基数 → 电网侧能量的折算系数，按窗口（充/放）预先算好：
+    # (physics, sample 窗口平均, sample 逐点积分)；两种口径只差乘数，不再分支重复计算
+    grid_factors = {
+        True: (dod / max(eta, 1e-9), eta / max(dod, 1e-9), eta / max(dod, 1e-9)),
+        False: (dod * eta, 1.0 / (max(dod, 1e-9) * max(eta, 1e-9)), 1.0 / max(dod * eta, 1e-9)),
+    }
+    f_physics, f_sample, f_sample_step15 = np.array([grid_factors[is_ch] for is_ch in _CYCLE_IS_CHARGE]).T
+
+    day_items = sorted(daily_masks.items(), key=lambda kv: kv[0])
+    n_days = len(day_items)
+    # 结果行数已知（每天 1 行汇总 + 每窗口 1 行调试），预分配后按下标填充
+    n_win = len(_CYCLE_WINDOWS)
+    days: List[dict] = [None] * n_days  # type: ignore[list-item]
+    debug_rows: List[dict] = [None] * (n_win * n_days)  # type: ignore[list-item]
+    day_lo, day_hi = _day_bounds(s.index, [d for d, _ in day_items])
+    day_limits = np.array([month_limit[_month_key_of_date_str(d)] for d, _ in day_items], dtype=float)
+
+    # 全年数值核心一次完成：把各日 [lo, hi) 点位拼成一条点序列，
+    # 查 (天, 窗口, 小时) LUT 得到 (点, 窗口) 选择矩阵，再按天 bincount 聚合点数 / 负荷和 / 逐点许可能量
+    counts = day_hi - day_lo
+    pt_day = np.repeat(np.arange(n_days), counts)
+    pt_pos = np.arange(int(counts.sum())) + np.repeat(day_lo - (np.cumsum(counts) - counts), counts)
+    pt_hour = s_hour[pt_pos]
+    pt_load = s_load[pt_pos]
+    # daily_masks 的嵌套窗口条目只展开一次：(天, 窗口) 条目表，供 LUT 与调试行的小时列表共用
+    win_entries = [[masks.get(win, {}) for win, _ in _CYCLE_WINDOWS] for _, masks in day_items]
+    luts = (
+        np.array([[_window_mask(e, kind) for e, (_, kind) in zip(entries, _CYCLE_WINDOWS)] for entries in win_entries])
+        if n_days
+        else np.zeros((0, n_win, 24), dtype=bool)
+    )
+    pt_sel = luts[pt_day, :, pt_hour]
+    # 逐点许可功率（step_15 对照）：充电窗口用充电许可，放电窗口用放电许可；原地裁剪，不产生中间数组
+    allow_ch = day_limits[pt_day]
+    np.subtract(allow_ch, reserve_ch, out=allow_ch)
+    np.subtract(allow_ch, pt_load, out=allow_ch)
+    np.maximum(allow_ch, 0.0, out=allow_ch)
+    allow_dis = np.subtract(pt_load, reserve_dis)
+    np.maximum(allow_dis, 0.0, out=allow_dis)
+
+    # 各窗口的加权量共用同一块缓冲区
+    weight_buf = np.empty(len(pt_load), dtype=float)
+
+    def _per_day(weights: np.ndarray) -> np.ndarray:
+        return np.bincount(pt_day, weights=weights, minlength=n_days)
+
+    def _per_day_masked(w: int, values: np.ndarray) -> np.ndarray:
+        np.multiply(pt_sel[:, w], values, out=weight_buf)
+        return _per_day(weight_buf)
+
+    win_points = np.stack([_per_day(pt_sel[:, w]) for w in range(n_win)], axis=1).astype(np.int64)
+    win_load_sum = np.stack([_per_day_masked(w, pt_load) for w in range(n_win)], axis=1)
+    win_base_step15 = np.stack([
+        _per_day_masked(w, allow_ch if is_ch else allow_dis) * 0.25
+        for w, is_ch in enumerate(_CYCLE_IS_CHARGE)
+    ], axis=1)
+    day_has_positive = _per_day((pt_load > 0).astype(float)) > 0
+
+    # (天, 窗口) 指标整表向量化：窗口平均负荷 → 许可功率 → 电池侧能量 → 两套口径电网侧能量与满充比例
+    has_points = win_points > 0
+    avg_load = np.divide(win_load_sum, win_points, out=np.zeros(win_points.shape), where=has_points)
+    hours = win_points * 0.25
+    allow = np.fmax(
+        np.where(np.array(_CYCLE_IS_CHARGE), day_limits[:, None] - reserve_ch - avg_load, avg_load - reserve_dis),
+        0.0,
+    )
+    base_kwh = allow * hours
+
+    def _full_ratio(e_grid: np.ndarray) -> np.ndarray:
+        return np.minimum(e_grid / cap, 1.0) if cap > 0 else np.zeros_like(e_grid)
+
+    e_grid_physics = base_kwh * f_physics
+    e_grid_sample = base_kwh * f_sample
+    full_ratio_physics = _full_ratio(e_grid_physics)
+    full_ratio_sample = _full_ratio(e_grid_sample)
+    # 附加对照：逐 15 分钟积分（step_15，不改变主口径，仅用于报表对拍）
+    e_grid_physics_step15 = win_base_step15 * f_physics
+    e_grid_sample_step15 = win_base_step15 * f_sample_step15
+    full_ratio_physics_step15 = _full_ratio(e_grid_physics_step15)
+    full_ratio_sample_step15 = _full_ratio(e_grid_sample_step15)
+
+    # 维持原有字段（随 energy_formula 切换）；无点位的窗口比例记 0
+    if energy_formula == "physics":
+        e_grid, full_ratio = e_grid_physics, full_ratio_physics
+    else:
+        e_grid, full_ratio = e_grid_sample, full_ratio_sample
+    full_ratio = np.where(has_points, full_ratio, 0.0)
+    day_cycles = (
+        np.minimum(full_ratio[:, 0], full_ratio[:, 1]) + np.minimum(full_ratio[:, 2], full_ratio[:, 3])
+    ).tolist()
+
+    # 逐行组装只做取值；各列整表转为 Python 列表一次
+    metric_cols = {
+        "points": win_points,
+        "avg_load_kw": avg_load,
+        "hours": hours,
+        "allow_kw": allow,
+        "base_kwh": base_kwh,
+        # 主口径当前值（随 energy_formula 切换）
+        "e_grid_kwh": e_grid,
+        "full_ratio": full_ratio,
+        # physics 与 sample 两套对拍（窗口平均）
+        "e_grid_kwh_physics": e_grid_physics,
+        "full_ratio_physics": full_ratio_physics,
+        "e_grid_kwh_sample": e_grid_sample,
+        "full_ratio_sample": full_ratio_sample,
+        # 逐点积分对照（step_15）
+        "base_kwh_step15": win_base_step15,
+        "e_grid_kwh_physics_step15": e_grid_physics_step15,
+        "full_ratio_physics_step15": full_ratio_physics_step15,
+        "e_grid_kwh_sample_step15": e_grid_sample_step15,
+        "full_ratio_sample_step15": full_ratio_sample_step15,
+    }
+    metric_keys = list(metric_cols)
+    metric_vals = [arr.tolist() for arr in metric_cols.values()]
+    empty_metrics = {
+        "points": 0,
+        "avg_load_kw": 0.0,
+        "hours": 0.0,
+        "allow_kw": 0.0,
+        "base_kwh": 0.0,
+        "e_grid_kwh": 0.0,
+        "full_ratio": 0.0,
+        # 对照：逐点积分（step_15）
+        "base_kwh_step15": 0.0,
+        "e_grid_kwh_step15": 0.0,
+        "full_ratio_step15": 0.0,
+    }
+    points_list = metric_vals[0]
 
+    for i, (date_str, _) in enumerate(day_items):
+        limit_kw = float(day_limits[i])
         # 判断该天数据是否有效
-        point_count = len(day_sub)
-        has_positive_load = bool((day_sub["load_kw"] > 0).any()) if point_count > 0 else False
-        is_valid = point_count > 0 and has_positive_load
-
-        c1 = masks.get("c1", {})
-        c2 = masks.get("c2", {})
+        point_count = int(counts[i])
+        is_valid = point_count > 0 and bool(day_has_positive[i])
 
-        # c1 charge/discharge
-        m1c = c1.get("charge_hours", [])
-        m1d = c1.get("discharge_hours", [])
-        met1c, fc1, e1c = _window_metrics(day_sub, m1c, limit_kw, True)
-        met1d, fd1, e1d = _window_metrics(day_sub, m1d, limit_kw, False)
-        
-        c1_cycles = min(fc1, fd1)
-
-        debug_rows.append({
-            "date": date_str,
-            "window": "c1",
-            "kind": "charge",
-            "hour_list": ",".join(str(int(h)) for h in (m1c or [])),
-            "limit_kw": limit_kw,
-            **met1c,
-        })
-        debug_rows.append({
-            "date": date_str,
-            "window": "c1",
-            "kind": "discharge",
-            "hour_list": ",".join(str(int(h)) for h in (m1d or [])),
-            "limit_kw": limit_kw,
-            **met1d,
-        })
-
-        # c2 charge/discharge
-        m2c = c2.get("charge_hours", [])
-        m2d = c2.get("discharge_hours", [])
-        met2c, fc2, e2c = _window_metrics(day_sub, m2c, limit_kw, True)
-        met2d, fd2, e2d = _window_metrics(day_sub, m2d, limit_kw, False)
-        
-        c2_cycles = min(fc2, fd2)
+        for w, (win, kind) in enumerate(_CYCLE_WINDOWS):
+            row = {
+                "date": date_str,
+                "window": win,
+                "kind": kind,
+                "hour_list": _fmt_hours(tuple(win_entries[i][w].get(f"{kind}_hours") or ())),
+                "limit_kw": limit_kw,
+            }
+            if points_list[i][w]:
+                row.update(zip(metric_keys, (col[i][w] for col in metric_vals)))
+            else:
+                row.update(empty_metrics)
+            debug_rows[n_win * i + w] = row
 
-        debug_rows.append({
+        days[i] = {
             "date": date_str,
-            "window": "c2",
-            "kind": "charge",
-            "hour_list": ",".join(str(int(h)) for h in (m2c or [])),
-            "limit_kw": limit_kw,
-            **met2c,
-        })
-        debug_rows.append({
-            "date": date_str,
-            "window": "c2",
-            "kind": "discharge",
-            "hour_list": ",".join(str(int(h)) for h in (m2d or [])),
-            "limit_kw": limit_kw,
-            **met2d,
-        })
-
-        days.append({
-            "date": date_str,
-            "cycles": float(c1_cycles + c2_cycles),
+            "cycles": float(day_cycles[i]),
             "is_valid": is_valid,
             "point_count": point_count,
-        })
+        }
 
     return days, debug_rows
 
@@ -981,70 +1250,122 @@ def _build_cycles_stats_from_window_debug(
       - eq_cycles_sample
       - window_count: 当日有效窗口数量（c1/c2 * 充/放 有任一非空即计数）
     """
+    stats_cols = ["date", "eq_cycles_physics", "eq_cycles_sample", "window_count"]
     if not window_debug:
-        return pd.DataFrame(columns=["date", "eq_cycles_physics", "eq_cycles_sample", "window_count"])
+        return pd.DataFrame(columns=stats_cols)
 
-    # (date, window) -> per-window stats
-    per_window: Dict[tuple[str, str], Dict[str, Any]] = {}
+    # (date, window) -> [physics 充, physics 放, sample 充, sample 放, 有充电小时, 有放电小时]
+    per_window: Dict[tuple[str, str], list] = {}
     for row in window_debug:
         try:
             date_str = str(row.get("date") or "")
             win = str(row.get("window") or "").lower()
-            kind = str(row.get("kind") or "").lower()
-            if not date_str or win not in {"c1", "c2"}:
+            if not date_str or win not in ("c1", "c2"):
                 continue
             wkey = (date_str, win)
-            rec = per_window.setdefault(
-                wkey,
-                {
-                    "physics_charge": 0.0,
-                    "physics_discharge": 0.0,
-                    "sample_charge": 0.0,
-                    "sample_discharge": 0.0,
-                    "has_charge": False,
-                    "has_discharge": False,
-                },
-            )
-
-            phys = float(row.get("full_ratio_physics", 0.0) or 0.0)
-            samp = float(row.get("full_ratio_sample", 0.0) or 0.0)
+            rec = per_window.get(wkey)
+            if rec is None:
+                rec = per_window[wkey] = [0.0, 0.0, 0.0, 0.0, False, False]
 
+            kind = str(row.get("kind") or "").lower()
             if kind == "charge":
-                rec["physics_charge"] = phys
-                rec["sample_charge"] = samp
-                rec["has_charge"] = rec.get("has_charge", False) or bool(row.get("hour_list"))
+                slot = 0
             elif kind == "discharge":
-                rec["physics_discharge"] = phys
-                rec["sample_discharge"] = samp
-                rec["has_discharge"] = rec.get("has_discharge", False) or bool(row.get("hour_list"))
+                slot = 1
+            else:
+                continue
+            rec[slot] = float(row.get("full_ratio_physics", 0.0) or 0.0)
+            rec[2 + slot] = float(row.get("full_ratio_sample", 0.0) or 0.0)
+            rec[4 + slot] = rec[4 + slot] or bool(row.get("hour_list"))
         except Exception:
             continue
 
-    # 按日聚合
-    per_day: Dict[str, Dict[str, Any]] = {}
-    for (date_str, _win), rec in per_window.items():
-        drec = per_day.setdefault(date_str, {
-            "eq_cycles_physics": 0.0,
-            "eq_cycles_sample": 0.0,
-            "window_count": 0,
-        })
-        eq_phys = min(float(rec.get("physics_charge", 0.0) or 0.0), float(rec.get("physics_discharge", 0.0) or 0.0))
-        eq_samp = min(float(rec.get("sample_charge", 0.0) or 0.0), float(rec.get("sample_discharge", 0.0) or 0.0))
-        drec["eq_cycles_physics"] += eq_phys
-        drec["eq_cycles_sample"] += eq_samp
-        if rec.get("has_charge") or rec.get("has_discharge"):
-            drec["window_count"] += 1
-
-    rows = [
-        {
-            "date": d,
-            "eq_cycles_physics": float(v.get("eq_cycles_physics", 0.0) or 0.0),
-            "eq_cycles_sample": float(v.get("eq_cycles_sample", 0.0) or 0.0),
-            "window_count": int(v.get("window_count", 0) or 0),
-        }
-        for d, v in sorted(per_day.items(), key=lambda kv: kv[0])
-    ]
-    return pd.DataFrame(rows)
+    # 按日聚合（单次遍历，直接累加到列）
+    per_day: Dict[str, list] = {}
+    for (date_str, _win), (phys_c, phys_d, samp_c, samp_d, has_c, has_d) in per_window.items():
+        drec = per_day.get(date_str)
+        if drec is None:
+            drec = per_day[date_str] = [0.0, 0.0, 0]
+        drec[0] += min(phys_c, phys_d)
+        drec[1] += min(samp_c, samp_d)
+        if has_c or has_d:
+            drec[2] += 1
+
+    # 无任何 c1/c2 行时与空输入一致：返回带列名的空表
+    dates = sorted(per_day)
+    if not dates:
+        return pd.DataFrame(columns=stats_cols)
+    return pd.DataFrame({
+        "date": dates,
+        "eq_cycles_physics": [per_day[d][0] for d in dates],
+        "eq_cycles_sample": [per_day[d][1] for d in dates],
+        "window_count": [per_day[d][2] for d in dates],
+    })
+
+
+def _write_csv_zip(zip_path: Path, csv_tables: List[tuple[str, pd.DataFrame]]) -> Path:
+    """把多张表直接编码为 CSV（utf-8-sig，与单独落盘的文件字节一致）写入 ZIP，不经磁盘中转。
+
+    to_csv 直接写入 ZIP 成员流，pandas 按行分块编码，峰值内存不随整张 CSV 文本增长。
+    """
+    # 压缩级别 1：数值 CSV 体积只比默认级别大约一成，压缩耗时约为其 1/4
+    # 写入失败时删除不完整的 ZIP 并上抛异常（与逐个落盘时一致），不留下半截成员
+    try:
+        with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+            for name, df in csv_tables:
+                with zf.open(name, "w", force_zip64=True) as zout:
+                    df.to_csv(zout, index=False, encoding="utf-8-sig")
+    except Exception:
+        zip_path.unlink(missing_ok=True)
+        raise
+    return zip_path
+
+
+# step15 明细中各口径的 (充电电量, 放电电量, 电网侧功率) 列名
+_STEP15_FORMULA_COLS = {
+    "physics": ("e_in_physics_kwh", "e_out_physics_kwh", "p_grid_effect_physics_kw"),
+    "sample": ("e_in_sample_kwh", "e_out_sample_kwh", "p_grid_effect_sample_kw"),
+}
+
+_PROFIT_FORMULAS = ("main", "physics", "sample")
+_PROFIT_METRICS = ("revenue", "cost", "profit", "discharge_energy_kwh", "charge_energy_kwh", "profit_per_kwh")
+
+# 收益明细表的中文列名（列结构固定，导入时一次展开）
+_PROFIT_FORMULA_ZH = {"main": "主口径", "physics": "物理模型", "sample": "样本模型"}
+_PROFIT_METRIC_ZH = {
+    "revenue": "电费收入(元)",
+    "cost": "电费成本(元)",
+    "profit": "净收益(元)",
+    "discharge_energy_kwh": "放电电量(kWh)",
+    "charge_energy_kwh": "充电电量(kWh)",
+    "profit_per_kwh": "单位收益(元/kWh)",
+}
+_PROFIT_RENAME = {
+    "date": "日期",
+    "year_month": "年月",
+    "year": "年份",
+    **{
+        f"{formula}_{metric}": f"{formula_zh}_{metric_zh}"
+        for formula, formula_zh in _PROFIT_FORMULA_ZH.items()
+        for metric, metric_zh in _PROFIT_METRIC_ZH.items()
+    },
+}
+
+
+def _build_profit_df(key_name: str, keys: List[Any], entries: List[Optional[Dict[str, dict]]]) -> pd.DataFrame:
+    """将 main/physics/sample 收益条目按列拍平成表（每个口径一次 from_records），便于导出调试。
+
+    列顺序：key_name, {formula}_{metric}...；缺失口径 / 指标按 0 计。
+    """
+    parts = [pd.DataFrame({key_name: keys})]
+    for formula in _PROFIT_FORMULAS:
+        metrics = pd.DataFrame.from_records(
+            [((e or {}).get(formula) or {}) for e in entries],
+            columns=list(_PROFIT_METRICS),
+        )
+        metrics = metrics.apply(pd.to_numeric, errors="coerce").fillna(0.0).astype(float)
+        parts.append(metrics.add_prefix(f"{formula}_"))
+    return pd.concat(parts, axis=1)
 
 
 def _build_step15_business_stats(
@@ -1060,74 +1381,76 @@ def _build_step15_business_stats(
         empty = pd.DataFrame()
         return empty, empty, empty
 
-    s = step15_df.copy()
-    if not isinstance(s.index, pd.DatetimeIndex):
-        s.index = pd.to_datetime(s.index, errors="coerce")
-    s = s.sort_index()
+    src = _with_datetime_index(step15_df)
 
     main_formula = (energy_formula or "physics").strip()
     if main_formula not in ("physics", "sample"):
         main_formula = "physics"
 
-    # 主口径能量与功率
-    if main_formula == "physics":
-        s["e_in_main_kwh"] = s.get("e_in_physics_kwh", 0.0)
-        s["e_out_main_kwh"] = s.get("e_out_physics_kwh", 0.0)
-        s["p_grid_main_kw"] = s.get("p_grid_effect_physics_kw", 0.0)
-    else:
-        s["e_in_main_kwh"] = s.get("e_in_sample_kwh", 0.0)
-        s["e_out_main_kwh"] = s.get("e_out_sample_kwh", 0.0)
-        s["p_grid_main_kw"] = s.get("p_grid_effect_sample_kw", 0.0)
+    # 只取用到的列组成新表（主口径能量与功率按口径选列），不复制整张 step15 明细
+    e_in_col, e_out_col, p_grid_col = _STEP15_FORMULA_COLS[main_formula]
+    s = pd.DataFrame(
+        {
+            "load_kw": src["load_kw"],
+            "p_batt_kw": src["p_batt_kw"],
+            "soc": src["soc"],
+            "tier": src["tier"],
+            "price": src["price"],
+            "e_in_main_kwh": src.get(e_in_col, 0.0),
+            "e_out_main_kwh": src.get(e_out_col, 0.0),
+            "p_grid_main_kw": src.get(p_grid_col, 0.0),
+        },
+        index=src.index,
+    )
+    if not s.index.is_monotonic_increasing:
+        s = s.sort_index()
 
-    s["date_str"] = s.index.strftime("%Y-%m-%d")
-    s["year_month"] = s.index.strftime("%Y-%m")
+    s["date_str"] = _date_categories(s.index)
     s["load_with_storage_main_kw"] = s["load_kw"] + s["p_grid_main_kw"]
 
-    # 精简 step15 曲线表
-    def _net_revenue_row(row: pd.Series) -> float:
-        price = row.get("price")
-        try:
-            price_f = float(price) if price is not None and pd.notna(price) else 0.0
-        except Exception:
-            price_f = 0.0
-        e_in = float(row.get("e_in_main_kwh", 0.0) or 0.0)
-        e_out = float(row.get("e_out_main_kwh", 0.0) or 0.0)
-        return (e_out - e_in) * price_f
-
-    slim = s[[
-        "load_kw",
-        "load_with_storage_main_kw",
-        "p_batt_kw",
-        "soc",
-        "tier",
-        "price",
-        "e_in_main_kwh",
-        "e_out_main_kwh",
-    ]].copy()
-    slim["net_revenue_step15_main"] = slim.apply(_net_revenue_row, axis=1)
+    # 精简 step15 曲线表（按列组成新表，后续加列不触发链式赋值告警）
+    slim = pd.DataFrame({
+        col: s[col]
+        for col in (
+            "load_kw",
+            "load_with_storage_main_kw",
+            "p_batt_kw",
+            "soc",
+            "tier",
+            "price",
+            "e_in_main_kwh",
+            "e_out_main_kwh",
+        )
+    })
+    # 逐点净收益 = (放电 - 充电) × 电价；缺失 / 无法解析的电价按 0 计
+    price = pd.to_numeric(slim["price"], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+    e_in = _to_float_column(slim["e_in_main_kwh"]).to_numpy()
+    e_out = _to_float_column(slim["e_out_main_kwh"]).to_numpy()
+    slim["net_revenue_step15_main"] = (e_out - e_in) * price
     slim = slim.reset_index().rename(columns={"index": "timestamp"})
     try:
-        slim["timestamp"] = pd.to_datetime(slim["timestamp"], errors="coerce").dt.strftime("%Y-%m-%dT%H:%M:%S")
+        slim["timestamp"] = _iso_seconds(slim["timestamp"])
     except Exception:
         pass
 
-    # 日统计
-    daily_stats = s.groupby("date_str").agg(
+    # 日统计（按日期分类编码分组；输出的日期列还原为普通字符串）
+    daily_stats = s.groupby("date_str", observed=True).agg(
         max_load_kw=("load_kw", "max"),
         max_load_with_storage_kw=("load_with_storage_main_kw", "max"),
         charge_energy_kwh=("e_in_main_kwh", "sum"),
         discharge_energy_kwh=("e_out_main_kwh", "sum"),
     )
     daily_stats = daily_stats.reset_index().rename(columns={"date_str": "date"})
-
-    # 月统计
-    monthly_stats = s.groupby("year_month").agg(
-        max_load_kw=("load_kw", "max"),
-        max_load_with_storage_kw=("load_with_storage_main_kw", "max"),
-        charge_energy_kwh=("e_in_main_kwh", "sum"),
-        discharge_energy_kwh=("e_out_main_kwh", "sum"),
+    daily_stats["date"] = daily_stats["date"].astype(object)
+
+    # 月统计：由日统计再聚合（最大值取日最大值的最大，能量为日能量之和），不再扫描 15 分钟明细
+    monthly_stats = daily_stats.groupby(daily_stats["date"].str[:7].rename("year_month")).agg(
+        max_load_kw=("max_load_kw", "max"),
+        max_load_with_storage_kw=("max_load_with_storage_kw", "max"),
+        charge_energy_kwh=("charge_energy_kwh", "sum"),
+        discharge_energy_kwh=("discharge_energy_kwh", "sum"),
     )
-    monthly_stats = monthly_stats.reset_index().rename(columns={"year_month": "year_month"})
+    monthly_stats = monthly_stats.reset_index()
 
     return slim, daily_stats, monthly_stats
 
@@ -1164,10 +1487,11 @@ def export_excel_report(
     - 逐点功率与负荷
     - 窗口调试明细 / 逐小时运行逻辑 / 连段合并调试
     """
-    out_dir.mkdir(parents=True, exist_ok=True)
+    os.makedirs(out_dir, exist_ok=True)
     base = os.path.splitext(os.path.basename(source_filename))[0] or "result"
     summary_csv: Path | None = None
-    csv_files: List[Path] = []
+    # (ZIP 内文件名, 表)；统一在末尾直接编码写入 ZIP，不落盘中转
+    csv_tables: List[tuple[str, pd.DataFrame]] = []
 
     # 构造 DataFrame
     df_days = pd.DataFrame(days)
@@ -1185,20 +1509,6 @@ def export_excel_report(
         "transformer_limit_kw": [limit_info.get("transformer_limit_kw")],
     })
 
-    def _build_profit_row(key_name: str, key_value: Any, entry: Dict[str, dict]) -> dict:
-        """将单个 main/physics/sample 收益条目拍平成一行，便于导出调试。"""
-        row: Dict[str, Any] = {key_name: key_value}
-        for formula in ("main", "physics", "sample"):
-            m = entry.get(formula) or {}
-            prefix = f"{formula}_"
-            row[prefix + "revenue"] = float(m.get("revenue", 0.0) or 0.0)
-            row[prefix + "cost"] = float(m.get("cost", 0.0) or 0.0)
-            row[prefix + "profit"] = float(m.get("profit", 0.0) or 0.0)
-            row[prefix + "discharge_energy_kwh"] = float(m.get("discharge_energy_kwh", 0.0) or 0.0)
-            row[prefix + "charge_energy_kwh"] = float(m.get("charge_energy_kwh", 0.0) or 0.0)
-            row[prefix + "profit_per_kwh"] = float(m.get("profit_per_kwh", 0.0) or 0.0)
-        return row
-
     # 结果汇总（中文列名）
     df_days_zh = (
         df_days.rename(
@@ -1234,23 +1544,15 @@ def export_excel_report(
     )
 
     if not df_days_zh.empty:
-        p = out_dir / f"{base}_日度次数明细.csv"
-        df_days_zh.to_csv(p, index=False, encoding="utf-8-sig")
-        csv_files.append(p)
+        csv_tables.append((f"{base}_日度次数明细.csv", df_days_zh))
     if not df_months_zh.empty:
-        p = out_dir / f"{base}_月度次数明细.csv"
-        df_months_zh.to_csv(p, index=False, encoding="utf-8-sig")
-        csv_files.append(p)
+        csv_tables.append((f"{base}_月度次数明细.csv", df_months_zh))
     if not df_year_zh.empty:
-        p = out_dir / f"{base}_年度次数汇总.csv"
-        df_year_zh.to_csv(p, index=False, encoding="utf-8-sig")
-        csv_files.append(p)
+        csv_tables.append((f"{base}_年度次数汇总.csv", df_year_zh))
 
     # 分时电价快照（本身以中文电价档位为列，保持不变）
     if not df_prices.empty:
-        p = out_dir / f"{base}_分时电价.csv"
-        df_prices.to_csv(p, index=False, encoding="utf-8-sig")
-        csv_files.append(p)
+        csv_tables.append((f"{base}_分时电价.csv", df_prices))
 
     # 质量与上限信息
     qc_head_zh = qc_head.rename(
@@ -1262,9 +1564,7 @@ def export_excel_report(
         }
     )
     if not qc_head_zh.empty:
-        p = out_dir / f"{base}_质量与上限-汇总.csv"
-        qc_head_zh.to_csv(p, index=False, encoding="utf-8-sig")
-        csv_files.append(p)
+        csv_tables.append((f"{base}_质量与上限-汇总.csv", qc_head_zh))
 
     monthly_limit_zh = (
         monthly_limit.rename(columns={"year_month": "年月", "max_kw": "当月最大需量(kW)"})
@@ -1272,17 +1572,13 @@ def export_excel_report(
         else monthly_limit
     )
     if not monthly_limit_zh.empty:
-        p = out_dir / f"{base}_质量与上限-月度上限.csv"
-        monthly_limit_zh.to_csv(p, index=False, encoding="utf-8-sig")
-        csv_files.append(p)
+        csv_tables.append((f"{base}_质量与上限-月度上限.csv", monthly_limit_zh))
 
     qc_notes_zh = (
         qc_notes.rename(columns={"notes": "备注说明"}) if not qc_notes.empty else qc_notes
     )
     if not qc_notes_zh.empty:
-        p = out_dir / f"{base}_质量与上限-备注.csv"
-        qc_notes_zh.to_csv(p, index=False, encoding="utf-8-sig")
-        csv_files.append(p)
+        csv_tables.append((f"{base}_质量与上限-备注.csv", qc_notes_zh))
 
     # Summary（关键统计一页表）
     try:
@@ -1340,9 +1636,7 @@ def export_excel_report(
                 "transformer_limit_kw": "变压器上限(kW)",
             }
         )
-        p = out_dir / f"{base}_统计汇总.csv"
-        summary_df_zh.to_csv(p, index=False, encoding="utf-8-sig")
-        csv_files.append(p)
+        csv_tables.append((f"{base}_统计汇总.csv", summary_df_zh))
     except Exception:
         pass
 
@@ -1352,124 +1646,49 @@ def export_excel_report(
         months_map = (profit_summary or {}).get("months") or {}
         year_entry = (profit_summary or {}).get("year") or None
 
-        def _rename_profit_df(df: pd.DataFrame) -> pd.DataFrame:
-            mapping: Dict[str, str] = {}
-            for col in df.columns:
-                if col == "date":
-                    mapping[col] = "日期"
-                elif col == "year_month":
-                    mapping[col] = "年月"
-                elif col == "year":
-                    mapping[col] = "年份"
-                elif col.endswith("_revenue"):
-                    prefix = col.split("_", 1)[0]
-                    name = {
-                        "main": "主口径",
-                        "physics": "物理模型",
-                        "sample": "样本模型",
-                    }.get(prefix, prefix)
-                    mapping[col] = f"{name}_电费收入(元)"
-                elif col.endswith("_cost"):
-                    prefix = col.split("_", 1)[0]
-                    name = {
-                        "main": "主口径",
-                        "physics": "物理模型",
-                        "sample": "样本模型",
-                    }.get(prefix, prefix)
-                    mapping[col] = f"{name}_电费成本(元)"
-                elif col.endswith("_profit"):
-                    prefix = col.split("_", 1)[0]
-                    name = {
-                        "main": "主口径",
-                        "physics": "物理模型",
-                        "sample": "样本模型",
-                    }.get(prefix, prefix)
-                    mapping[col] = f"{name}_净收益(元)"
-                elif col.endswith("_discharge_energy_kwh"):
-                    prefix = col.split("_", 1)[0]
-                    name = {
-                        "main": "主口径",
-                        "physics": "物理模型",
-                        "sample": "样本模型",
-                    }.get(prefix, prefix)
-                    mapping[col] = f"{name}_放电电量(kWh)"
-                elif col.endswith("_charge_energy_kwh"):
-                    prefix = col.split("_", 1)[0]
-                    name = {
-                        "main": "主口径",
-                        "physics": "物理模型",
-                        "sample": "样本模型",
-                    }.get(prefix, prefix)
-                    mapping[col] = f"{name}_充电电量(kWh)"
-                elif col.endswith("_profit_per_kwh"):
-                    prefix = col.split("_", 1)[0]
-                    name = {
-                        "main": "主口径",
-                        "physics": "物理模型",
-                        "sample": "样本模型",
-                    }.get(prefix, prefix)
-                    mapping[col] = f"{name}_单位收益(元/kWh)"
-            return df.rename(columns=mapping)
 
         if days_map:
-            rows_days: List[dict] = []
-            for dkey in sorted(days_map.keys()):
-                entry = days_map.get(dkey) or {}
-                rows_days.append(_build_profit_row("date", dkey, entry))
-            df_profit_days = pd.DataFrame(rows_days)
-            df_profit_days_zh = _rename_profit_df(df_profit_days)
-            p = out_dir / f"{base}_日度收益明细.csv"
-            df_profit_days_zh.to_csv(p, index=False, encoding="utf-8-sig")
-            csv_files.append(p)
+            day_keys = sorted(days_map.keys())
+            df_profit_days = _build_profit_df("date", day_keys, [days_map.get(k) for k in day_keys])
+            df_profit_days_zh = df_profit_days.rename(columns=_PROFIT_RENAME)
+            csv_tables.append((f"{base}_日度收益明细.csv", df_profit_days_zh))
 
         if months_map:
-            rows_months: List[dict] = []
-            for ym in sorted(months_map.keys()):
-                entry = months_map.get(ym) or {}
-                rows_months.append(_build_profit_row("year_month", ym, entry))
-            df_profit_months = pd.DataFrame(rows_months)
-            df_profit_months_zh = _rename_profit_df(df_profit_months)
-            p = out_dir / f"{base}_月度收益明细.csv"
-            df_profit_months_zh.to_csv(p, index=False, encoding="utf-8-sig")
-            csv_files.append(p)
+            month_keys = sorted(months_map.keys())
+            df_profit_months = _build_profit_df("year_month", month_keys, [months_map.get(k) for k in month_keys])
+            df_profit_months_zh = df_profit_months.rename(columns=_PROFIT_RENAME)
+            csv_tables.append((f"{base}_月度收益明细.csv", df_profit_months_zh))
 
         if isinstance(year_entry, dict) and year_entry:
             year_val = year.get("year", 0) if isinstance(year, dict) else 0
-            row_year = _build_profit_row("year", year_val, year_entry)
-            df_profit_year = pd.DataFrame([row_year])
-            df_profit_year_zh = _rename_profit_df(df_profit_year)
-            p = out_dir / f"{base}_年度收益汇总.csv"
-            df_profit_year_zh.to_csv(p, index=False, encoding="utf-8-sig")
-            csv_files.append(p)
+            df_profit_year = _build_profit_df("year", [year_val], [year_entry])
+            df_profit_year_zh = df_profit_year.rename(columns=_PROFIT_RENAME)
+            csv_tables.append((f"{base}_年度收益汇总.csv", df_profit_year_zh))
 
     # 逐 15 分钟功率 / 负荷明细（可选）
     if step15_df is not None and not step15_df.empty:
-        df_power = step15_df.copy()
-        df_power = df_power.reset_index().rename(columns={"index": "timestamp"})
+        # reset_index 已产生新表，其后的改名均原地进行，不再整表复制
+        df_power = step15_df.reset_index()
+        df_power.rename(columns={"index": "timestamp"}, inplace=True)
         # 统一时间戳格式，便于在 CSV / Excel 中过滤
         try:
-            df_power["timestamp"] = pd.to_datetime(df_power["timestamp"], errors="coerce").dt.strftime(
-                "%Y-%m-%dT%H:%M:%S"
-            )
+            df_power["timestamp"] = _iso_seconds(df_power["timestamp"])
         except Exception:  # pragma: no cover - 调试容错
             pass
 
         # 加上“引入储能后负荷”列（physics / sample 两套）
-        for suffix, col in (("physics", "p_grid_effect_physics_kw"), ("sample", "p_grid_effect_sample_kw")):
+        for suffix, (_, _, col) in _STEP15_FORMULA_COLS.items():
             if col in df_power.columns:
                 df_power[f"load_with_storage_{suffix}_kw"] = df_power["load_kw"] + df_power[col]
 
-        # 标记主口径，便于对照 StorageProfit 页
-        main_col = (
-            "p_grid_effect_physics_kw"
-            if (energy_formula or "physics").strip() == "physics"
-            else "p_grid_effect_sample_kw"
-        )
+        # 标记主口径，便于对照 StorageProfit 页（储能后负荷直接复用上面已算好的同口径列）
+        main_key = "physics" if (energy_formula or "physics").strip() == "physics" else "sample"
+        main_col = _STEP15_FORMULA_COLS[main_key][2]
         if main_col in df_power.columns:
             df_power["p_grid_effect_main_kw"] = df_power[main_col]
-            df_power["load_with_storage_main_kw"] = df_power["load_kw"] + df_power["p_grid_effect_main_kw"]
+            df_power["load_with_storage_main_kw"] = df_power[f"load_with_storage_{main_key}_kw"]
 
-        df_power_zh = df_power.rename(
+        df_power.rename(
             columns={
                 "timestamp": "时间",
                 "load_kw": "原始负荷(kW)",
@@ -1492,12 +1711,11 @@ def export_excel_report(
                 "load_with_storage_physics_kw": "physics_储能后负荷(kW)",
                 "load_with_storage_sample_kw": "sample_储能后负荷(kW)",
                 "load_with_storage_main_kw": "主口径_储能后负荷(kW)",
-            }
+            },
+            inplace=True,
         )
 
-        p = out_dir / f"{base}_逐点功率与负荷.csv"
-        df_power_zh.to_csv(p, index=False, encoding="utf-8-sig")
-        csv_files.append(p)
+        csv_tables.append((f"{base}_逐点功率与负荷.csv", df_power))
 
     # 窗口汇总明细（可选）
     if window_debug:
@@ -1558,9 +1776,7 @@ def export_excel_report(
                 "full_ratio_sample_step15": "逐点_sample_等效次数",
             }
         )
-        p = out_dir / f"{base}_窗口调试明细.csv"
-        df_win_zh.to_csv(p, index=False, encoding="utf-8-sig")
-        csv_files.append(p)
+        csv_tables.append((f"{base}_窗口调试明细.csv", df_win_zh))
 
     # 每小时运行逻辑（可选）
     if ops_by_hour:
@@ -1572,9 +1788,7 @@ def export_excel_report(
                 df_ops[c] = None
         df_ops = df_ops[cols_ops]
         df_ops_zh = df_ops.rename(columns={"date": "日期"})
-        p = out_dir / f"{base}_逐小时运行逻辑.csv"
-        df_ops_zh.to_csv(p, index=False, encoding="utf-8-sig")
-        csv_files.append(p)
+        csv_tables.append((f"{base}_逐小时运行逻辑.csv", df_ops_zh))
 
     # 连段合并过程（可选）
     if runs_debug:
@@ -1607,9 +1821,7 @@ def export_excel_report(
                 "wrap_across_midnight": "是否跨零点合并",
             }
         )
-        p = out_dir / f"{base}_连段合并调试.csv"
-        df_runs_zh.to_csv(p, index=False, encoding="utf-8-sig")
-        csv_files.append(p)
+        csv_tables.append((f"{base}_连段合并调试.csv", df_runs_zh))
 
     # 生成 CSV 简表（与原行为保持一致，单独提供 summary.csv）
     try:
@@ -1622,7 +1834,7 @@ def export_excel_report(
         summary_csv = None
 
     # 若没有任何明细 CSV（极端情况），直接返回 summary_csv 或占位文件
-    if not csv_files:
+    if not csv_tables:
         if summary_csv is not None:
             return summary_csv, summary_csv
         placeholder = out_dir / f"{base}_计算结果_empty.csv"
@@ -1630,14 +1842,7 @@ def export_excel_report(
         return placeholder, summary_csv
 
     # 将所有 CSV 打包为一个 ZIP，供前端一次性下载
-    zip_path = out_dir / f"{base}_计算结果_csv.zip"
-    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-        for f in csv_files:
-            try:
-                zf.write(f, arcname=f.name)
-            except Exception:
-                # 某个文件写入失败不影响整体报表
-                continue
+    zip_path = _write_csv_zip(out_dir / f"{base}_计算结果_csv.zip", csv_tables)
 
     return zip_path, summary_csv
 
@@ -1664,7 +1869,7 @@ def export_business_report(
       - 逐点曲线精简:  {base}_逐点曲线精简.csv
     最终返回的 Path 指向一个 ZIP 文件，前端仍通过 excel_path 下载。
     """
-    out_dir.mkdir(parents=True, exist_ok=True)
+    os.makedirs(out_dir, exist_ok=True)
     base = os.path.splitext(os.path.basename(source_filename))[0] or "result"
 
     df_days = pd.DataFrame(days or [])
@@ -1679,19 +1884,17 @@ def export_business_report(
     # - 零散缺天：按“该月有效天日均收益”外推到该月自然天数
     # - 整月缺失（该月有效天数=0）：不做外推，等效收益留空
     month_valid_days_map: Dict[str, int] = {}
-    if not df_days.empty:
-        for _, row in df_days.iterrows():
-            date_str = str(row.get("date") or "")
-            if len(date_str) < 7:
-                continue
-            ym = date_str[:7]
-            if "is_valid" in df_days.columns:
-                is_valid_val = row.get("is_valid")
-                is_valid = True if pd.isna(is_valid_val) else bool(is_valid_val)
-            else:
-                is_valid = True
-            if is_valid:
-                month_valid_days_map[ym] = month_valid_days_map.get(ym, 0) + 1
+    if not df_days.empty and "date" in df_days.columns:
+        date_strs = df_days["date"].where(df_days["date"].notna(), "").astype(str)
+        # is_valid 缺列或缺值均视为有效
+        if "is_valid" in df_days.columns:
+            valid = df_days["is_valid"].isna().to_numpy() | df_days["is_valid"].to_numpy().astype(bool)
+        else:
+            valid = np.ones(len(df_days), dtype=bool)
+        counted = date_strs[(date_strs.str.len() >= 7).to_numpy() & valid]
+        month_valid_days_map = {
+            str(ym): int(n) for ym, n in counted.str[:7].value_counts(sort=False).items()
+        }
 
     # 从 window_debug 提取每日等效次数与窗口数
     cycles_stats = _build_cycles_stats_from_window_debug(window_debug, energy_formula=energy_formula)
@@ -1705,58 +1908,52 @@ def export_business_report(
     profit_days = (profit_summary or {}).get("days") or {}
     profit_months = (profit_summary or {}).get("months") or {}
 
-    csv_files: List[Path] = []
+    # (ZIP 内文件名, 表)；统一在末尾直接编码写入 ZIP，不落盘中转
+    csv_tables: List[tuple[str, pd.DataFrame]] = []
 
     # ========= 日度业务统计 =========
-    daily_rows: List[dict] = []
+    # 等效次数 / 窗口数与日最大需量按日期左连接（一次哈希连接，替代逐日布尔筛选）
+    df_daily: Optional[pd.DataFrame] = None
     if not df_days.empty:
-        for _, row in df_days.sort_values("date").iterrows():
-            date_str = str(row.get("date"))
-            base_cycles = float(row.get("cycles", 0.0) or 0.0)
-
-            # 等效次数 & 窗口数
-            cs = (
-                cycles_stats[cycles_stats["date"] == date_str].iloc[0]
-                if not cycles_stats.empty and (cycles_stats["date"] == date_str).any()
-                else None
-            )
-            eq_phys = float(cs["eq_cycles_physics"]) if cs is not None else 0.0
-            eq_samp = float(cs["eq_cycles_sample"]) if cs is not None else 0.0
-            win_cnt = int(cs["window_count"]) if cs is not None else 0
-
-            # 日度主口径收益与能量（来自 profit_days.main）
-            p_entry = profit_days.get(date_str) or {}
-            p_main = p_entry.get("main") or {}
-            profit_main = float(p_main.get("profit", 0.0) or 0.0)
-            charge_kwh = float(p_main.get("charge_energy_kwh", 0.0) or 0.0)
-            discharge_kwh = float(p_main.get("discharge_energy_kwh", 0.0) or 0.0)
-
-            # 日度最大需量（原始 / 储能后）
-            srow = (
-                step15_daily[step15_daily["date"] == date_str].iloc[0]
-                if not step15_daily.empty and (step15_daily["date"] == date_str).any()
-                else None
-            )
-            max_load = float(srow["max_load_kw"]) if srow is not None else 0.0
-            max_load_with = float(srow["max_load_with_storage_kw"]) if srow is not None else 0.0
-
-            daily_rows.append(
-                {
-                    "date": date_str,
-                    "cycles_main": base_cycles,
-                    "window_count": win_cnt,
-                    "eq_cycles_physics": eq_phys,
-                    "eq_cycles_sample": eq_samp,
-                    "profit_main_yuan": profit_main,
-                    "charge_energy_main_kwh": charge_kwh,
-                    "discharge_energy_main_kwh": discharge_kwh,
-                    "max_load_kw": max_load,
-                    "max_load_with_storage_kw": max_load_with,
-                }
-            )
+        days_sorted = df_days.sort_values("date")
+        df_daily = pd.DataFrame({
+            "date": days_sorted["date"].astype(str).to_numpy(),
+            "cycles_main": (
+                _to_float_column(days_sorted["cycles"]).to_numpy()
+                if "cycles" in days_sorted.columns
+                else np.zeros(len(days_sorted))
+            ),
+        })
+        df_daily = df_daily.merge(
+            cycles_stats.reindex(columns=["date", "window_count", "eq_cycles_physics", "eq_cycles_sample"]),
+            on="date",
+            how="left",
+        )
+        df_daily[["window_count", "eq_cycles_physics", "eq_cycles_sample"]] = (
+            df_daily[["window_count", "eq_cycles_physics", "eq_cycles_sample"]].astype(float).fillna(0.0)
+        )
+        df_daily["window_count"] = df_daily["window_count"].astype(int)
+
+        # 日度主口径收益与能量（来自 profit_days.main）
+        p_mains = [((profit_days.get(d) or {}).get("main") or {}) for d in df_daily["date"]]
+        for col, key in (
+            ("profit_main_yuan", "profit"),
+            ("charge_energy_main_kwh", "charge_energy_kwh"),
+            ("discharge_energy_main_kwh", "discharge_energy_kwh"),
+        ):
+            df_daily[col] = [float(p.get(key, 0.0) or 0.0) for p in p_mains]
+
+        # 日度最大需量（原始 / 储能后）
+        df_daily = df_daily.merge(
+            step15_daily.reindex(columns=["date", "max_load_kw", "max_load_with_storage_kw"]),
+            on="date",
+            how="left",
+        )
+        df_daily[["max_load_kw", "max_load_with_storage_kw"]] = (
+            df_daily[["max_load_kw", "max_load_with_storage_kw"]].astype(float).fillna(0.0)
+        )
 
-    if daily_rows:
-        df_daily = pd.DataFrame(daily_rows)
+    if df_daily is not None:
         df_daily_zh = df_daily.rename(
             columns={
                 "date": "日期",
@@ -1771,90 +1968,90 @@ def export_business_report(
                 "max_load_with_storage_kw": "储能后最大需量(kW)",
             }
         )
-        csv_path = out_dir / f"{base}_日度运行统计.csv"
-        df_daily_zh.to_csv(csv_path, index=False, encoding="utf-8-sig")
-        csv_files.append(csv_path)
+        csv_tables.append((f"{base}_日度运行统计.csv", df_daily_zh))
 
     # ========= 月度业务统计 =========
-    monthly_rows: List[dict] = []
+    # 与日度统计相同：各来源按年月左连接成整表，不再逐月筛选
+    df_monthly: Optional[pd.DataFrame] = None
     if not df_months.empty:
-        # 预先按月聚合等效次数与窗口数
-        if not cycles_stats.empty:
-            cycles_stats["year_month"] = cycles_stats["date"].str[:7]
-            cyc_month = (
-                cycles_stats.groupby("year_month")[["eq_cycles_physics", "eq_cycles_sample", "window_count"]]
-                .sum()
-                .reset_index()
-            )
-        else:
-            cyc_month = pd.DataFrame(
-                columns=["year_month", "eq_cycles_physics", "eq_cycles_sample", "window_count"]
-            )
-
-        for _, row in df_months.sort_values("year_month").iterrows():
-            ym = str(row.get("year_month"))
-            base_cycles = float(row.get("cycles", 0.0) or 0.0)
-
-            cs = (
-                cyc_month[cyc_month["year_month"] == ym].iloc[0]
-                if not cyc_month.empty and (cyc_month["year_month"] == ym).any()
-                else None
-            )
-            eq_phys = float(cs["eq_cycles_physics"]) if cs is not None else 0.0
-            eq_samp = float(cs["eq_cycles_sample"]) if cs is not None else 0.0
-            win_cnt = int(cs["window_count"]) if cs is not None else 0
-
-            # 月度主口径收益
-            p_entry = profit_months.get(ym) or {}
-            p_main = p_entry.get("main") or {}
-            profit_main = float(p_main.get("profit", 0.0) or 0.0)
+        months_sorted = df_months.sort_values("year_month")
+        df_monthly = pd.DataFrame({
+            "year_month": months_sorted["year_month"].astype(str).to_numpy(),
+            "cycles_main": (
+                _to_float_column(months_sorted["cycles"]).to_numpy()
+                if "cycles" in months_sorted.columns
+                else np.zeros(len(months_sorted))
+            ),
+        })
+        month_keys = df_monthly["year_month"].tolist()
+
+        # 等效次数与窗口数：日统计按月汇总
+        cyc_cols = ["eq_cycles_physics", "eq_cycles_sample", "window_count"]
+        cyc_month = (
+            cycles_stats.groupby(cycles_stats["date"].astype(str).str[:7].rename("year_month"))[cyc_cols]
+            .sum()
+            .reset_index()
+        )
+        df_monthly = df_monthly.merge(cyc_month, on="year_month", how="left")
+        df_monthly[cyc_cols] = df_monthly[cyc_cols].astype(float).fillna(0.0)
+        df_monthly["window_count"] = df_monthly["window_count"].astype(int)
+
+        # 有效天数与月度主口径收益
+        df_monthly["valid_days"] = [int(month_valid_days_map.get(ym, 0) or 0) for ym in month_keys]
+        profit_main = [
+            float((((profit_months.get(ym) or {}).get("main")) or {}).get("profit", 0.0) or 0.0)
+            for ym in month_keys
+        ]
+        df_monthly["profit_main_yuan"] = profit_main
 
-            # 月度等效收益（按月外推；整月缺失则留空）
-            month_valid_days = int(month_valid_days_map.get(ym, 0) or 0)
+        # 月度等效收益（按月外推；整月缺失则留空）
+        def _days_in_month(ym: str) -> int:
             try:
-                month_days_count = int(pd.Period(ym).days_in_month)
+                return int(pd.Period(ym).days_in_month)
             except Exception:
-                month_days_count = 0
-            profit_main_equiv: float | None
-            if month_valid_days > 0 and month_days_count > 0:
-                profit_main_equiv = profit_main / month_valid_days * month_days_count
-            else:
-                profit_main_equiv = None
+                return 0
 
-            # 月度充/放电量与最大需量
-            srow = (
-                step15_monthly[step15_monthly["year_month"] == ym].iloc[0]
-                if not step15_monthly.empty and (step15_monthly["year_month"] == ym).any()
-                else None
+        df_monthly["profit_main_equiv_yuan"] = [
+            p / n_valid * n_days if n_valid > 0 and n_days > 0 else None
+            for p, n_valid, n_days in zip(
+                profit_main, df_monthly["valid_days"].tolist(), map(_days_in_month, month_keys)
             )
-            max_load = float(srow["max_load_kw"]) if srow is not None else 0.0
-            max_load_with = float(srow["max_load_with_storage_kw"]) if srow is not None else 0.0
-            charge_kwh = float(srow["charge_energy_kwh"]) if srow is not None else 0.0
-            discharge_kwh = float(srow["discharge_energy_kwh"]) if srow is not None else 0.0
-
-            # 主口径窗口法等效次数：根据 energy_formula 选择 physics 或 sample
-            eq_cycles_main = eq_phys if main_formula == "physics" else eq_samp
+        ]
 
-            monthly_rows.append(
-                {
-                    "year_month": ym,
-                    "cycles_main": base_cycles,
-                    "window_count": win_cnt,
-                    "eq_cycles_physics": eq_phys,
-                    "eq_cycles_sample": eq_samp,
-                    "valid_days": month_valid_days,
-                    "profit_main_yuan": profit_main,
-                    "profit_main_equiv_yuan": profit_main_equiv,
-                    "charge_energy_main_kwh": charge_kwh,
-                    "discharge_energy_main_kwh": discharge_kwh,
-                    "max_load_kw": max_load,
-                    "max_load_with_storage_kw": max_load_with,
-                    "eq_cycles_main": eq_cycles_main,
-                }
-            )
+        # 月度充/放电量与最大需量
+        s15_cols = ["charge_energy_kwh", "discharge_energy_kwh", "max_load_kw", "max_load_with_storage_kw"]
+        df_monthly = df_monthly.merge(
+            step15_monthly.reindex(columns=["year_month", *s15_cols]), on="year_month", how="left"
+        )
+        df_monthly[s15_cols] = df_monthly[s15_cols].astype(float).fillna(0.0)
+        df_monthly = df_monthly.rename(
+            columns={
+                "charge_energy_kwh": "charge_energy_main_kwh",
+                "discharge_energy_kwh": "discharge_energy_main_kwh",
+            }
+        )
 
-    if monthly_rows:
-        df_monthly = pd.DataFrame(monthly_rows)
+        # 主口径窗口法等效次数：根据 energy_formula 选择 physics 或 sample
+        df_monthly["eq_cycles_main"] = df_monthly[
+            "eq_cycles_physics" if main_formula == "physics" else "eq_cycles_sample"
+        ]
+        df_monthly = df_monthly[[
+            "year_month",
+            "cycles_main",
+            "window_count",
+            "eq_cycles_physics",
+            "eq_cycles_sample",
+            "valid_days",
+            "profit_main_yuan",
+            "profit_main_equiv_yuan",
+            "charge_energy_main_kwh",
+            "discharge_energy_main_kwh",
+            "max_load_kw",
+            "max_load_with_storage_kw",
+            "eq_cycles_main",
+        ]]
+
+    if df_monthly is not None:
         # 月度运行统计中不再单独展示“主口径_等效次数(窗口法)”，避免与主口径_等效次数混淆
         df_monthly_for_sheet = df_monthly.drop(columns=["eq_cycles_main"], errors="ignore")
         df_monthly_zh = df_monthly_for_sheet.rename(
@@ -1873,62 +2070,23 @@ def export_business_report(
                 "max_load_with_storage_kw": "储能后最大需量(kW)",
             }
         )
-        csv_path = out_dir / f"{base}_月度运行统计.csv"
-        df_monthly_zh.to_csv(csv_path, index=False, encoding="utf-8-sig")
-        csv_files.append(csv_path)
+        csv_tables.append((f"{base}_月度运行统计.csv", df_monthly_zh))
 
     # ========= Dashboard（PPT 数据源） =========
-    if monthly_rows:
-        # 安全地创建 DataFrame
-        try:
-            df_temp = pd.DataFrame(monthly_rows)
-            
-            # 定义需要的列
-            required_cols = [
-                "year_month",
-                "eq_cycles_main",
-                "profit_main_yuan",
-                "profit_main_equiv_yuan",
-                "max_load_kw",
-                "max_load_with_storage_kw",
-                "charge_energy_main_kwh",
-                "discharge_energy_main_kwh",
-            ]
-            
-            # 确保所有需要的列都存在
-            for col in required_cols:
-                if col not in df_temp.columns:
-                    df_temp[col] = None  # 填充缺失的列为 None
-            
-            # 只选择存在的列
-            available_cols = [col for col in required_cols if col in df_temp.columns]
-            dash_df = df_temp[available_cols] if available_cols else pd.DataFrame(columns=required_cols)
-            
-            # 重命名列
-            rename_map = {
-                "year_month": "年月",
-                "eq_cycles_main": "主口径_等效次数(窗口法)",
-                "profit_main_yuan": "主口径_净收益(元)",
-                "profit_main_equiv_yuan": "主口径_等效净收益(元)",
-                "max_load_kw": "原始最大需量(kW)",
-                "max_load_with_storage_kw": "储能后最大需量(kW)",
-                "charge_energy_main_kwh": "主口径_充电电量(kWh)",
-                "discharge_energy_main_kwh": "主口径_放电电量(kWh)",
-            }
-            # 只重命名实际存在的列
-            actual_rename = {k: v for k, v in rename_map.items() if k in dash_df.columns}
-            dash_df_zh = dash_df.rename(columns=actual_rename)
-            
-            csv_path = out_dir / f"{base}_运行看板.csv"
-            dash_df_zh.to_csv(csv_path, index=False, encoding="utf-8-sig")
-            csv_files.append(csv_path)
-        except Exception as e:
-            # 创建空的 CSV 文件占位
-            csv_path = out_dir / f"{base}_运行看板_empty.csv"
-            pd.DataFrame(columns=["年月", "主口径_等效次数(窗口法)", "主口径_净收益(元)", "主口径_等效净收益(元)", 
-                                 "原始最大需量(kW)", "储能后最大需量(kW)", "主口径_充电电量(kWh)", "主口径_放电电量(kWh)"]).to_csv(
-                csv_path, index=False, encoding="utf-8-sig")
-            csv_files.append(csv_path)
+    if df_monthly is not None:
+        # 直接从月度表取看板所需列（缺失列由 reindex 补空），不再复制整张月度表
+        dashboard_cols = {
+            "year_month": "年月",
+            "eq_cycles_main": "主口径_等效次数(窗口法)",
+            "profit_main_yuan": "主口径_净收益(元)",
+            "profit_main_equiv_yuan": "主口径_等效净收益(元)",
+            "max_load_kw": "原始最大需量(kW)",
+            "max_load_with_storage_kw": "储能后最大需量(kW)",
+            "charge_energy_main_kwh": "主口径_充电电量(kWh)",
+            "discharge_energy_main_kwh": "主口径_放电电量(kWh)",
+        }
+        dash_df_zh = df_monthly.reindex(columns=list(dashboard_cols)).rename(columns=dashboard_cols)
+        csv_tables.append((f"{base}_运行看板.csv", dash_df_zh))
 
     # ========= 精简 step15 曲线 =========
     if step15_slim is not None and not step15_slim.empty:
@@ -1946,9 +2104,7 @@ def export_business_report(
                 "net_revenue_step15_main": "主口径_当时点净收益(元)",
             }
         )
-        csv_path = out_dir / f"{base}_逐点曲线精简.csv"
-        step15_zh.to_csv(csv_path, index=False, encoding="utf-8-sig")
-        csv_files.append(csv_path)
+        csv_tables.append((f"{base}_逐点曲线精简.csv", step15_zh))
 
     # ========= 年度现金流明细 =========
     year_cashflow_rows: List[dict] = []
@@ -2023,27 +2179,16 @@ def export_business_report(
                 "sample_discharge_kwh": "Sample_放电量(kWh)",
             }
         )
-        csv_path = out_dir / f"{base}_年度现金流明细.csv"
-        df_year_cashflow_zh.to_csv(csv_path, index=False, encoding="utf-8-sig")
-        csv_files.append(csv_path)
+        csv_tables.append((f"{base}_年度现金流明细.csv", df_year_cashflow_zh))
 
     # 若无任何 CSV，返回一个空文件占位，避免前端报错
-    if not csv_files:
+    if not csv_tables:
         empty_path = out_dir / f"{base}_运行收益报表_empty.csv"
         pd.DataFrame([]).to_csv(empty_path, index=False, encoding="utf-8-sig")
         return empty_path
 
     # 打包为 ZIP，减小传输体积，便于一次性下载全部表格
-    zip_path = out_dir / f"{base}_运行收益报表_csv.zip"
-    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-        for f in csv_files:
-            try:
-                zf.write(f, arcname=f.name)
-            except Exception:
-                # 某个文件写入失败不影响整体报表
-                continue
-
-    return zip_path
+    return _write_csv_zip(out_dir / f"{base}_运行收益报表_csv.zip", csv_tables)
 
 
 def build_step15_power_series(
@@ -2078,30 +2223,24 @@ def build_step15_power_series(
         return pd.DataFrame()
 
     # 统一时间索引与列名
-    s = series_15m.copy()
-    if not isinstance(s.index, pd.DatetimeIndex):
-        s.index = pd.to_datetime(s.index, errors="coerce")
-    s = s.dropna(subset=["load_kw"]).sort_index()
+    s = _with_datetime_index(series_15m).dropna(subset=["load_kw"]).sort_index()
     if "load_kw" not in s.columns:
         logger.warning("[profit_step15] series_15m 缺少 load_kw 列，无法计算收益")
         return pd.DataFrame()
 
     # 若指定 filter_date，提前过滤数据，大幅减少计算量
     if filter_date:
-        s = s[s.index.strftime("%Y-%m-%d") == filter_date]
+        s = s[_day_mask(s.index, filter_date)]
         if s.empty:
             logger.warning("[profit_step15] filter_date=%s 未找到数据", filter_date)
             return pd.DataFrame()
 
     # 价格序列对齐，如果不存在则补空列
     if price_series is not None and not price_series.empty:
-        p = price_series.copy()
-        if not isinstance(p.index, pd.DatetimeIndex):
-            p.index = pd.to_datetime(p.index, errors="coerce")
-        p = p.sort_index()
+        p = _with_datetime_index(price_series).sort_index()
         # 若指定了 filter_date，也过滤价格序列
         if filter_date:
-            p = p[p.index.strftime("%Y-%m-%d") == filter_date]
+            p = p[_day_mask(p.index, filter_date)]
         joined = s.join(p[["price", "tier"]], how="left")
     else:
         joined = s.copy()
@@ -2118,8 +2257,7 @@ def build_step15_power_series(
     transformer_limit_kw = limit_info.get("transformer_limit_kw")
     limit_mode = (limit_info.get("limit_mode") or "monthly_demand_max").strip() or "monthly_demand_max"
 
-    def _day_limit_kw(ts: pd.Timestamp) -> float:
-        ym = ts.strftime("%Y-%m")
+    def _day_limit_kw(ym: str) -> float:
         if limit_mode == "transformer_capacity" and transformer_limit_kw:
             try:
                 return float(transformer_limit_kw)
@@ -2153,16 +2291,11 @@ def build_step15_power_series(
     main_formula = (energy_formula or "physics").strip()
     main_formula = main_formula if main_formula in ("physics", "sample") else "physics"
 
-    # 运行逻辑编码（与前端 / _extract_hour_ops 保持一致）
-    OP_STANDBY = "待机"
-    OP_CHARGE = "充"
-    OP_DISCHARGE = "放"
-
-    def _op_for_ts(ts: pd.Timestamp) -> Optional[str]:
-        day_key = ts.strftime("%Y-%m-%d")
-        ops = daily_ops.get(day_key) or []
-        h = ts.hour
-        return ops[h] if 0 <= h < len(ops) else None
+    # 运行逻辑编码（标签与前端 / _extract_hour_ops 保持一致）
+    # 内部按 int8 编码比较，输出时以分类列还原为中文标签
+    OP_LABELS = ("待机", "充", "放")
+    OP_STANDBY, OP_CHARGE, OP_DISCHARGE = 0, 1, 2
+    op_code_of = {label: code for code, label in enumerate(OP_LABELS)}
 
     # 构造窗口目标（基于 window_debug 的 step15 full_ratio）
     window_targets: Dict[tuple[str, str], dict] = {}
@@ -2203,21 +2336,13 @@ def build_step15_power_series(
             except Exception:
                 continue
 
-    def _window_key(ts: pd.Timestamp, op: Optional[str]) -> Optional[tuple[str, str]]:
-        date_str = ts.strftime("%Y-%m-%d")
-        h = ts.hour
-        # 仅在 window_targets 提供信息时使用
-        if not window_targets:
-            return None
-        candidates = []
-        for (d, w), info in window_targets.items():
-            if d != date_str:
-                continue
-            if op == OP_CHARGE and h in info.get("charge_hours", set()):
-                candidates.append((d, w))
-            elif op == OP_DISCHARGE and h in info.get("discharge_hours", set()):
-                candidates.append((d, w))
-        return candidates[0] if candidates else None
+    # (日期, 小时, 运行逻辑) -> 窗口键；同一时刻命中多个窗口时取 window_targets 中靠前者
+    window_key_lut: Dict[tuple[str, int, str], tuple[str, str]] = {}
+    for (d, w), info in window_targets.items():
+        for h in info.get("charge_hours", set()):
+            window_key_lut.setdefault((d, h, OP_CHARGE), (d, w))
+        for h in info.get("discharge_hours", set()):
+            window_key_lut.setdefault((d, h, OP_DISCHARGE), (d, w))
 
     # 窗口累计状态：charged/discharged（电网侧）
     window_state: Dict[tuple[str, str], dict] = {}
@@ -2228,110 +2353,97 @@ def build_step15_power_series(
     current_soc = max(soc_min, min(soc_max, initial_soc))  # 限制在有效范围
     usable_capacity = cap * (soc_max - soc_min) if cap > 0 else 0.0  # 可用容量
 
-    records: List[dict] = []
-    for ts, row in joined.iterrows():
-        try:
-            load_kw = float(row.get("load_kw", 0.0) or 0.0)
-        except Exception:  # pragma: no cover
-            load_kw = 0.0
+    # 日期 / 月份 / 小时整列一次性计算，循环内不再逐点 strftime
+    date_strs = joined.index.strftime("%Y-%m-%d").tolist()
+    year_months = [d[:7] for d in date_strs]
+    hour_arr = joined.index.hour.to_numpy()
+    hours = hour_arr.tolist()
 
-        price_val = row.get("price")
-        try:
-            price = float(price_val) if price_val is not None and pd.notna(price_val) else None
-        except Exception:  # pragma: no cover
-            price = None
-
-        tier = row.get("tier")
-        op = _op_for_ts(ts)
-        limit_kw = _day_limit_kw(ts)
-        win_key = _window_key(ts, op)
-
-        # 电池侧功率：对电池为正充电，负为放电
-        # 重要：功率需要受到储能最大功率 p_max = c_rate * capacity 的限制
-        p_batt = 0.0
-        if op == OP_CHARGE:
-            # 可用充电功率 = min(需量上限 - 预留 - 负荷, 储能最大功率)
-            p_batt_raw = max(limit_kw - reserve_ch - load_kw, 0.0)
-            p_batt = min(p_batt_raw, p_max) if p_max > 0 else p_batt_raw
-        elif op == OP_DISCHARGE:
-            # 可用放电功率 = min(负荷 - 预留, 储能最大功率)
-            p_batt_raw = max(load_kw - reserve_dis, 0.0)
-            p_batt = -min(p_batt_raw, p_max) if p_max > 0 else -p_batt_raw
-        else:
-            p_batt = 0.0
-
-        # 分别在 physics / sample 口径下计算电网侧能量
-        e_in_phys = 0.0
-        e_out_phys = 0.0
-        e_in_sample = 0.0
-        e_out_sample = 0.0
-
-        if p_batt > 0:  # 充电
-            e_batt = p_batt * dt_hours
-            # physics: E_in_grid = base_kwh * DOD / η
-            e_in_phys = e_batt * (effective_dod / max(eta, 1e-9))
-            # sample: E_in_grid = base_kwh / DOD * η
-            e_in_sample = e_batt * (eta / max(effective_dod, 1e-9))
-        elif p_batt < 0:  # 放电
-            e_batt = -p_batt * dt_hours
-            # physics: E_out_grid = base_kwh * DOD * η
-            e_out_phys = e_batt * (effective_dod * eta)
-            # sample: E_out_grid = base_kwh / DOD / η
-            e_out_sample = e_batt * (1.0 / max(effective_dod * eta, 1e-9))
-
-        # 对电网视角的等效功率（正：从电网取电，负：向电网送电）
-        p_grid_phys = (e_in_phys - e_out_phys) / dt_hours if dt_hours > 0 else 0.0
-        p_grid_sample = (e_in_sample - e_out_sample) / dt_hours if dt_hours > 0 else 0.0
-
-        # 在变压器容量口径下，确保“引入储能后的负荷”不会在充电段进一步突破上限
-        # 注意：原始负荷本身若已超过上限，这里不会强行截断，只保证储能本身不会再向上推高。
-        if limit_mode == "transformer_capacity" and limit_kw and load_kw < limit_kw:
-            max_p_grid_charge = max(p_grid_phys, p_grid_sample, 0.0)
-            if max_p_grid_charge > 0:
-                load_with_max = load_kw + max_p_grid_charge
-                if load_with_max > limit_kw + 1e-6:
-                    # 允许的电网侧“额外功率”
-                    allowed_extra = max(limit_kw - load_kw, 0.0)
-                    if allowed_extra <= 0:
-                        scale_cap = 0.0
-                    else:
-                        scale_cap = allowed_extra / max_p_grid_charge
-                    if scale_cap < 0:
-                        scale_cap = 0.0
-                    if scale_cap < 1.0:
-                        # 按比例缩放所有与电池相关的量，保持 physics / sample 两个口径一致
-                        p_batt *= scale_cap
-                        e_in_phys *= scale_cap
-                        e_out_phys *= scale_cap
-                        e_in_sample *= scale_cap
-                        e_out_sample *= scale_cap
-                        p_grid_phys *= scale_cap
-                        p_grid_sample *= scale_cap
-
-        # 禁止“余电上网”：不允许引入储能后的负荷变为负值
-        # 注意：这里是针对电网视角的总负荷（原始负荷 + 储能影响），与计费口径无关。
-        if load_kw > 0:
-            max_discharge = max(-p_grid_phys, -p_grid_sample, 0.0)
-            if max_discharge > 0:
-                allowed_discharge = max(load_kw - reserve_dis, 0.0)  # 保持放电余量 reserve_dis
-                if max_discharge > allowed_discharge + 1e-6:
-                    scale_dis = allowed_discharge / max_discharge if allowed_discharge > 0 else 0.0
-                    if scale_dis < 0:
-                        scale_dis = 0.0
-                    if scale_dis < 1.0:
-                        p_batt *= scale_dis
-                        e_in_phys *= scale_dis
-                        e_out_phys *= scale_dis
-                        e_in_sample *= scale_dis
-                        e_out_sample *= scale_dis
-                        p_grid_phys *= scale_dis
-                        p_grid_sample *= scale_dis
-
-        # 窗口充放能量目标（对称约束）
-        cum_charge = None
-        cum_discharge = None
-        charge_target = None
-        discharge_target = None
+    n = len(joined)
+    if n == 0:
+        return pd.DataFrame()
+
+    # 整列一次性转换类型：load_kw 已在上方 dropna，价格缺失 / 无法解析时为 NaN
+    load_out = pd.to_numeric(joined["load_kw"], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+    price_out = pd.to_numeric(joined["price"], errors="coerce").to_numpy(dtype=float)
+    # 运行逻辑按 (日, 小时) 展开为 int8 矩阵（缺失日 / 小时视为待机），逐点取值即数组索引
+    day_idx, day_keys = pd.factorize(pd.Series(date_strs))
+    op_matrix = np.full((len(day_keys), 24), OP_STANDBY, dtype=np.int8)
+    for r, day_key in enumerate(day_keys):
+        for h, label in enumerate((daily_ops.get(day_key) or [])[:24]):
+            op_matrix[r, h] = op_code_of.get(label, OP_STANDBY)
+    op_code = op_matrix[day_idx, hour_arr]
+    is_charge = op_code == OP_CHARGE
+    is_discharge = op_code == OP_DISCHARGE
+    limit_out = np.array([_day_limit_kw(ym) for ym in year_months], dtype=float)
+
+    # 电池侧功率：对电池为正充电，负为放电
+    # 重要：功率需要受到储能最大功率 p_max = c_rate * capacity 的限制
+    # 可用充电功率 = min(需量上限 - 预留 - 负荷, 储能最大功率)
+    p_charge = np.maximum(limit_out - reserve_ch - load_out, 0.0)
+    # 可用放电功率 = min(负荷 - 预留, 储能最大功率)
+    p_discharge = np.maximum(load_out - reserve_dis, 0.0)
+    if p_max > 0:
+        p_charge = np.minimum(p_charge, p_max)
+        p_discharge = np.minimum(p_discharge, p_max)
+    p_batt = np.where(is_charge, p_charge, np.where(is_discharge, -p_discharge, 0.0))
+
+    # 与电池相关的 7 个量按列放在同一矩阵中，各类约束统一按行缩放：
+    # p_batt / e_in_phys / e_out_phys / e_in_sample / e_out_sample / p_grid_phys / p_grid_sample
+    E = np.zeros((n, 7))
+    E[:, 0] = p_batt
+    # 分别在 physics / sample 口径下计算电网侧能量
+    e_batt_in = np.where(p_batt > 0, p_batt * dt_hours, 0.0)  # 充电
+    e_batt_out = np.where(p_batt < 0, -p_batt * dt_hours, 0.0)  # 放电
+    # physics: E_in_grid = base_kwh * DOD / η，E_out_grid = base_kwh * DOD * η
+    E[:, 1] = e_batt_in * (effective_dod / max(eta, 1e-9))
+    E[:, 2] = e_batt_out * (effective_dod * eta)
+    # sample: E_in_grid = base_kwh / DOD * η，E_out_grid = base_kwh / DOD / η
+    E[:, 3] = e_batt_in * (eta / max(effective_dod, 1e-9))
+    E[:, 4] = e_batt_out * (1.0 / max(effective_dod * eta, 1e-9))
+    # 对电网视角的等效功率（正：从电网取电，负：向电网送电）
+    E[:, 5] = (E[:, 1] - E[:, 2]) / dt_hours
+    E[:, 6] = (E[:, 3] - E[:, 4]) / dt_hours
+
+    # 在变压器容量口径下，确保“引入储能后的负荷”不会在充电段进一步突破上限
+    # 注意：原始负荷本身若已超过上限，这里不会强行截断，只保证储能本身不会再向上推高。
+    if limit_mode == "transformer_capacity":
+        max_p_grid_charge = np.maximum(np.maximum(E[:, 5], E[:, 6]), 0.0)
+        over = (
+            (limit_out != 0)
+            & (load_out < limit_out)
+            & (max_p_grid_charge > 0)
+            & (load_out + max_p_grid_charge > limit_out + 1e-6)
+        )
+        if over.any():
+            # 允许的电网侧“额外功率”，按比例缩放所有与电池相关的量，保持 physics / sample 两个口径一致
+            E[over] *= ((limit_out[over] - load_out[over]) / max_p_grid_charge[over])[:, None]
+
+    # 禁止“余电上网”：不允许引入储能后的负荷变为负值
+    # 注意：这里是针对电网视角的总负荷（原始负荷 + 储能影响），与计费口径无关。
+    max_discharge = np.maximum(np.maximum(-E[:, 5], -E[:, 6]), 0.0)
+    allowed_discharge = np.maximum(load_out - reserve_dis, 0.0)  # 保持放电余量 reserve_dis
+    over = (load_out > 0) & (max_discharge > 0) & (max_discharge > allowed_discharge + 1e-6)
+    if over.any():
+        E[over] *= (allowed_discharge[over] / max_discharge[over])[:, None]
+
+    # 窗口充放能量目标（对称约束）与 SOC 依赖累计状态，仍需按时间顺序逐点推进
+    cum_charge_out: List[Optional[float]] = [None] * n
+    cum_discharge_out: List[Optional[float]] = [None] * n
+    charge_target_out: List[Optional[float]] = [None] * n
+    discharge_target_out: List[Optional[float]] = [None] * n
+    soc_out = np.empty(n)
+    main_in_col, main_out_col = (1, 2) if main_formula == "physics" else (3, 4)
+    for i, date_str, h, op, p_batt_i, e_in_main, e_out_main in zip(
+        range(n),
+        date_strs,
+        hours,
+        op_code.tolist(),
+        E[:, 0].tolist(),
+        E[:, main_in_col].tolist(),
+        E[:, main_out_col].tolist(),
+    ):
+        win_key = window_key_lut.get((date_str, h, op)) if window_key_lut else None
         if win_key and cap > 0 and effective_dod > 0:
             state = window_state.setdefault(win_key, {
                 "charged": 0.0,
@@ -2344,91 +2456,67 @@ def build_step15_power_series(
                 full_main = float(info.get("full_ratio_main", 1.0) or 1.0)
                 usable_batt = cap * full_main
                 usable_batt_dod = usable_batt * effective_dod
-                charge_target = usable_batt_dod / max(eta, 1e-9)
-                discharge_target = usable_batt_dod * eta
-                state["charge_target"] = charge_target
-                state["discharge_target"] = discharge_target
+                state["charge_target"] = usable_batt_dod / max(eta, 1e-9)
+                state["discharge_target"] = usable_batt_dod * eta
             charge_target = state["charge_target"]
             discharge_target = state["discharge_target"]
-            # 按主口径能量判断超额
-            e_in_main = e_in_phys if main_formula == "physics" else e_in_sample
-            e_out_main = e_out_phys if main_formula == "physics" else e_out_sample
+            # 按主口径能量判断超额，超额时缩放该点所有能量/功率
             if op == OP_CHARGE and charge_target:
                 allowed = max(charge_target - state["charged"], 0.0)
                 if e_in_main > allowed + 1e-9:
                     scale_win = allowed / max(e_in_main, 1e-9)
-                    # 缩放所有能量/功率
-                    p_batt *= scale_win
-                    e_in_phys *= scale_win
-                    e_out_phys *= scale_win
-                    e_in_sample *= scale_win
-                    e_out_sample *= scale_win
-                    p_grid_phys *= scale_win
-                    p_grid_sample *= scale_win
-                    e_in_main = e_in_phys if main_formula == "physics" else e_in_sample
+                    E[i] *= scale_win
+                    p_batt_i *= scale_win
+                    e_in_main *= scale_win
             elif op == OP_DISCHARGE and discharge_target:
                 allowed = max(discharge_target - state["discharged"], 0.0)
                 if e_out_main > allowed + 1e-9:
                     scale_win = allowed / max(e_out_main, 1e-9)
-                    p_batt *= scale_win
-                    e_in_phys *= scale_win
-                    e_out_phys *= scale_win
-                    e_in_sample *= scale_win
-                    e_out_sample *= scale_win
-                    p_grid_phys *= scale_win
-                    p_grid_sample *= scale_win
-                    e_out_main = e_out_phys if main_formula == "physics" else e_out_sample
+                    E[i] *= scale_win
+                    p_batt_i *= scale_win
+                    e_out_main *= scale_win
             # 更新累计
             state["charged"] += e_in_main
             state["discharged"] += e_out_main
-            cum_charge = state["charged"]
-            cum_discharge = state["discharged"]
-        else:
-            cum_charge = None
-            cum_discharge = None
-            charge_target = None
-            discharge_target = None
+            cum_charge_out[i] = state["charged"]
+            cum_discharge_out[i] = state["discharged"]
+            charge_target_out[i] = charge_target
+            discharge_target_out[i] = discharge_target
 
         # 更新 SOC（基于电池侧能量，非电网侧）
         # p_batt > 0 表示充电，< 0 表示放电
-        soc_before = current_soc
         if cap > 0:
-            # 电池侧能量变化（kWh）
-            e_batt_change = p_batt * dt_hours  # 正=充电增加，负=放电减少
-            # SOC 变化
-            delta_soc = e_batt_change / cap if cap > 0 else 0.0
-            current_soc = max(soc_min, min(soc_max, current_soc + delta_soc))
-
-        records.append(
-            {
-                "timestamp": ts,
-                "load_kw": load_kw,
-                "price": price,
-                "tier": tier,
-                "date_str": ts.strftime("%Y-%m-%d"),
-                "year_month": ts.strftime("%Y-%m"),
-                "op": op or OP_STANDBY,
-                "limit_kw": float(limit_kw) if limit_kw is not None else None,
-                "p_max_kw": p_max,  # 储能最大功率
-                "p_batt_kw": p_batt,
-                "soc": current_soc,  # 当前 SOC（时间点结束时的值）
-                "e_in_physics_kwh": e_in_phys,
-                "e_out_physics_kwh": e_out_phys,
-                "e_in_sample_kwh": e_in_sample,
-                "e_out_sample_kwh": e_out_sample,
-                "p_grid_effect_physics_kw": p_grid_phys,
-                "p_grid_effect_sample_kw": p_grid_sample,
-                "cum_charge_grid_main": cum_charge,
-                "cum_discharge_grid_main": cum_discharge,
-                "charge_target_grid_main": charge_target,
-                "discharge_target_grid_main": discharge_target,
-            }
-        )
+            # 电池侧能量变化（kWh）：正=充电增加，负=放电减少
+            e_batt_change = p_batt_i * dt_hours
+            current_soc = max(soc_min, min(soc_max, current_soc + e_batt_change / cap))
+        soc_out[i] = current_soc  # 当前 SOC（时间点结束时的值）
 
-    if not records:
-        return pd.DataFrame()
-
-    df = pd.DataFrame.from_records(records).set_index("timestamp").sort_index()
+    # joined 已按时间排序，直接沿用其索引
+    df = pd.DataFrame(
+        {
+            "load_kw": load_out,
+            "price": price_out,
+            "tier": joined["tier"].tolist(),
+            "date_str": date_strs,
+            "year_month": year_months,
+            "op": pd.Categorical.from_codes(op_code, categories=OP_LABELS),
+            "limit_kw": limit_out,
+            "p_max_kw": np.full(n, p_max),  # 储能最大功率
+            "p_batt_kw": E[:, 0],
+            "soc": soc_out,
+            "e_in_physics_kwh": E[:, 1],
+            "e_out_physics_kwh": E[:, 2],
+            "e_in_sample_kwh": E[:, 3],
+            "e_out_sample_kwh": E[:, 4],
+            "p_grid_effect_physics_kw": E[:, 5],
+            "p_grid_effect_sample_kw": E[:, 6],
+            "cum_charge_grid_main": cum_charge_out,
+            "cum_discharge_grid_main": cum_discharge_out,
+            "charge_target_grid_main": charge_target_out,
+            "discharge_target_grid_main": discharge_target_out,
+        },
+        index=pd.DatetimeIndex(joined.index, name="timestamp"),
+    )
     return df
 
 
@@ -2462,66 +2550,59 @@ def _allocate_discharge_by_price(
     
     df = discharge_points.copy()
     
-    # 添加价格列（从 price_series 映射）
-    df['price'] = df.index.map(price_series)
+    # 添加价格列（按时间索引对齐 price_series）
     # 对于缺失价格的点，使用 0（这些点不会参与优先分配）
-    df['price'] = df['price'].fillna(0.0)
+    price = pd.to_numeric(price_series.reindex(df.index), errors="coerce").fillna(0.0).to_numpy(dtype=float)
+    df['price'] = price
     
     logger.debug(f"[尖段优先] 📊 放电窗口包含 {len(df)} 个点，可用能量 {max_discharge_energy:.2f} kWh")
-    logger.debug(f"[尖段优先] 💰 价格范围: 最高={df['price'].max():.4f} 元/kWh, 最低={df['price'].min():.4f} 元/kWh, 平均={df['price'].mean():.4f} 元/kWh")
+    logger.debug(f"[尖段优先] 💰 价格范围: 最高={price.max():.4f} 元/kWh, 最低={price.min():.4f} 元/kWh, 平均={price.mean():.4f} 元/kWh")
     
     # 价格分布分析
-    unique_prices = df['price'].unique()
+    unique_prices = np.unique(price)[::-1]
     logger.debug(f"[尖段优先] 📈 价格档位: {len(unique_prices)} 档")
     if len(unique_prices) <= 5:
-        logger.debug(f"[尖段优先] 💵 所有价格: {sorted(unique_prices, reverse=True)}")
+        logger.debug(f"[尖段优先] 💵 所有价格: {unique_prices.tolist()}")
     else:
-        logger.debug(f"[尖段优先] 💵 前5高价: {sorted(unique_prices, reverse=True)[:5]}")
-    
-    # 按价格降序排列（价格相同时，保持原时间顺序）
-    # 先重置索引以便排序
-    df = df.reset_index().sort_values(['price', 'timestamp'], ascending=[False, True]).set_index('timestamp')
-    
-    remaining_energy = max_discharge_energy
-    df['allocated_energy_kwh'] = 0.0
+        logger.debug(f"[尖段优先] 💵 前5高价: {unique_prices[:5].tolist()}")
     
     # 这里不再重新计算“理论最大功率”，而是完全依赖传入的 per-point 上限
     # （来自时序策略或前序物理计算），仅做价格排序下的能量重分配。
     reserve_dis = float(storage_cfg.get('reserve_discharge_kw', 0) or 0)
     logger.debug(f"[尖段优先] 🔋 放电保留={reserve_dis:.2f} kW；将基于每点已有上限进行价格优先分配")
     
-    allocation_count = 0
-    for idx, row in df.iterrows():
-        if remaining_energy <= 1e-6:  # 能量耗尽
-            logger.debug(f"[尖段优先] ⚠️ 能量已耗尽，停止分配（已分配 {allocation_count} 个点）")
-            break
-        
-        # 该点最大可放电能量：使用事先算好的 "max_e_out_main_kwh" 作为物理上限
-        # 若不存在该列，则退化为使用当前时序放电量作为上限
-        max_energy_this_point = float(row.get("max_e_out_main_kwh", row.get("e_out_main_kwh", 0.0)) or 0.0)
-
-        # 再根据负荷保留做一次防御性裁剪
-        load_kw = float(row.get('load_kw', 0.0) or 0.0)
-        allow_by_load = max(load_kw - reserve_dis, 0.0) * 0.25
-        max_energy_this_point = max(0.0, min(max_energy_this_point, allow_by_load))
-
-        if max_energy_this_point <= 1e-9:
-            continue
-        
-        # 实际分配能量
-        allocated = min(max_energy_this_point, remaining_energy)
-        df.at[idx, 'allocated_energy_kwh'] = allocated
-        remaining_energy -= allocated
-        allocation_count += 1
-        
-        if allocation_count <= 3:  # 只打印前3个分配点的详情
-            logger.debug(f"[尖段优先]   → 点 {idx} (价格={row['price']:.4f}元/kWh): 分配 {allocated:.2f} kWh (剩余={remaining_energy:.2f} kWh)")
+    # 该点最大可放电能量：使用事先算好的 "max_e_out_main_kwh" 作为物理上限
+    # 若不存在该列，则退化为使用当前时序放电量作为上限
+    cap_col = "max_e_out_main_kwh" if "max_e_out_main_kwh" in df.columns else "e_out_main_kwh"
+    if cap_col in df.columns:
+        point_cap = pd.to_numeric(df[cap_col], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+    else:
+        point_cap = np.zeros(len(df))
+    # 再根据负荷保留做一次防御性裁剪
+    if "load_kw" in df.columns:
+        load_kw = pd.to_numeric(df["load_kw"], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+    else:
+        load_kw = np.zeros(len(df))
+    point_cap = np.maximum(0.0, np.minimum(point_cap, np.maximum(load_kw - reserve_dis, 0.0) * 0.25))
+    point_cap[point_cap <= 1e-9] = 0.0
     
-    total_allocated = df['allocated_energy_kwh'].sum()
-    logger.debug(f"[尖段优先] ✅ 分配完成: 共分配 {total_allocated:.2f} kWh / {max_discharge_energy:.2f} kWh ({total_allocated/max_discharge_energy*100:.1f}%)")
+    # 按价格降序排列（价格相同时，保持原时间顺序），再按累计上限贪心分配：
+    # 排在前面的点吃满上限，跨过剩余能量的那一点分到余量，之后的点为 0
+    order = np.lexsort((df.index.to_numpy(), -price))
+    cap_sorted = point_cap[order]
+    remaining_before = max_discharge_energy - (np.cumsum(cap_sorted) - cap_sorted)
+    allocated_sorted = np.where(
+        remaining_before > 1e-6, np.minimum(cap_sorted, remaining_before), 0.0
+    )
+    allocated = np.empty_like(allocated_sorted)
+    allocated[order] = allocated_sorted
+    df['allocated_energy_kwh'] = allocated
     
-    # 恢复原时间顺序
-    df = df.sort_index()
+    total_allocated = float(allocated.sum())
+    logger.debug(
+        f"[尖段优先] ✅ 分配完成: 共分配 {total_allocated:.2f} kWh / {max_discharge_energy:.2f} kWh "
+        f"({total_allocated/max_discharge_energy*100:.1f}%)，分配点数 {int((allocated > 0).sum())}"
+    )
     
     return df
 
@@ -2691,7 +2772,7 @@ def compute_profit_summary_step15(
             # 如果启用价格优先策略，重新分配放电能量（仅在 physics 口径下重排，保持物理上限不变）
             if discharge_strategy == "price-priority" and formula == main_formula:
                 # 为后续分配准备：记录当前时序放电作为物理上限
-                day_df["e_out_main_kwh"] = day_df[e_out_col].copy()
+                day_df["e_out_main_kwh"] = day_df[e_out_col]
 
                 # 筛选放电点（op == '放'）
                 discharge_mask = day_df["op"] == "放"
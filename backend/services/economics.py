@@ -477,15 +477,15 @@ def export_economics_cashflow_report(
         result: 经济性测算结果对象
         user_share_percent: 用户收益分成比例（0-100）
         yearly_discharge_energy_kwh: 各年度储能放电量（kWh）列表，长度应与项目年限一致
-        output_dir: 输出目录（默认使用 app_paths.OUTPUTS_DIR）
+        output_dir: 输出目录（默认使用 app_paths.outputs_dir()）
         filename_prefix: 文件名前缀
     
     Returns:
         生成的ZIP文件路径（相对于outputs目录）
     """
-    from .app_paths import OUTPUTS_DIR
+    from .app_paths import outputs_dir
     if output_dir is None:
-        output_dir = str(OUTPUTS_DIR)
+        output_dir = str(outputs_dir())
     os.makedirs(output_dir, exist_ok=True)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     zip_filename = f"{filename_prefix}_{timestamp}.zip"
@@ -1,16 +1,13 @@
 from __future__ import annotations
 
 import json
+import os
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, Optional, Tuple
 
-from .app_paths import STORE_DIR, SNAPSHOT_PATH
-
-
-def _ensure_store_dir() -> None:
-    STORE_DIR.mkdir(parents=True, exist_ok=True)
+from .app_paths import snapshot_path, store_dir
 
 
 def _parse_dt(value: Any) -> Optional[datetime]:
@@ -24,18 +21,27 @@ def _parse_dt(value: Any) -> Optional[datetime]:
 
 
 def read_snapshot() -> Optional[Dict[str, Any]]:
-    if not SNAPSHOT_PATH.exists():
+    path = snapshot_path()
+    if not path.exists():
         return None
     try:
-        raw = SNAPSHOT_PATH.read_text(encoding="utf-8")
+        raw = path.read_text(encoding="utf-8")
         return json.loads(raw)
     except Exception:
         return None
 
 
 def write_snapshot(snapshot: Dict[str, Any]) -> None:
-    _ensure_store_dir()
-    SNAPSHOT_PATH.write_text(json.dumps(snapshot, ensure_ascii=False), encoding="utf-8")
+    # store_dir() 首次访问时确保 store 目录存在（读取不创建目录）；
+    # 若目录在运行期间被删除，则重建后重试一次（正常路径不额外触发系统调用）
+    store_dir()
+    path = snapshot_path()
+    text = json.dumps(snapshot, ensure_ascii=False)
+    try:
+        path.write_text(text, encoding="utf-8")
+    except FileNotFoundError:
+        os.makedirs(path.parent, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
 
 
 def should_accept_incoming(existing: Optional[Dict[str, Any]], incoming: Dict[str, Any]) -> Tuple[bool, str]:
@@ -0,0 +1,21 @@
+"""build_price_series 回归测试：非 ns 精度（如 datetime64[us]）索引须与 ns 索引结果一致"""
+
+import pandas as pd
+
+from backend.services import cycles
+
+
+def test_non_ns_index_matches_ns_index():
+    idx = pd.date_range("2024-01-01", "2024-01-02 23:45", freq="15min")
+    series = pd.DataFrame({"load_kw": 100.0}, index=idx)
+    tous = ["谷"] * 8 + ["平"] * 4 + ["峰"] * 6 + ["尖"] * 2 + ["平"] * 4
+    schedule = [[{"tou": t, "op": "待机"} for t in tous] for _ in range(12)]
+    prices = [{"尖": 1.2, "峰": 0.9, "平": 0.6, "谷": 0.3, "深": 0.2} for _ in range(12)]
+
+    expected, expected_missing = cycles.build_price_series(series, schedule, [], prices)
+    series_us = series.set_axis(idx.as_unit("us"))
+    result, missing = cycles.build_price_series(series_us, schedule, [], prices)
+
+    assert missing == expected_missing
+    assert result["tier"].tolist() == expected["tier"].tolist()
+    assert result["price"].tolist() == expected["price"].tolist()
@@ -0,0 +1,18 @@
+"""parse_points_series 缓存键回归测试：混用 load / load_kwh 键名时不得命中错误缓存"""
+
+import pandas as pd
+
+from backend.services import cycles
+
+
+def test_mixed_load_keys_do_not_share_cache():
+    t0, t1 = "2024-01-01T00:00:00", "2024-01-01T00:15:00"
+    mixed = [{"timestamp": t0, "load_kwh": 1}, {"timestamp": t1, "load": 5}]
+    plain = [{"timestamp": t0, "load_kwh": 1}, {"timestamp": t1, "load_kwh": 5}]
+
+    first = cycles.parse_points_series(mixed)
+    second = cycles.parse_points_series(plain)
+
+    pd.testing.assert_frame_equal(first, cycles._parse_points_series(mixed))
+    pd.testing.assert_frame_equal(second, cycles._parse_points_series(plain))
+    assert second["load_kw"].tolist() == [1.0, 5.0]